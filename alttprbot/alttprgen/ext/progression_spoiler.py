@@ -20,7 +20,7 @@ REGIONLIST = [
     'Dark World'
 ]
 
-PROGRESSION_ITEMS = [
+PROGRESSION_ITEMS = frozenset([
     'L1Sword',
     'MasterSword',
     'ProgressiveSword',
@@ -69,7 +69,7 @@ PROGRESSION_ITEMS = [
     # 'TenBombs',
     # 'HalfMagic',
     # 'QuarterMagic'
-]
+])
 
 
 def create_progression_spoiler(seed):
@@ -1,28 +1,34 @@
+import copy
 import os
+import random
 
 import aiofiles
 import yaml
 from aiohttp.client_exceptions import ClientResponseError
 from tenacity import RetryError, AsyncRetrying, stop_after_attempt, retry_if_exception_type
 
-import pyz3r
 from alttprbot.alttprgen.preset import fetch_preset
 from alttprbot.alttprgen.randomizer import mysterydoors
+from alttprbot.alttprgen.weightsampler import CompiledWeightset
 from alttprbot.database import audit, config
 from alttprbot.exceptions import SahasrahBotException
 from alttprbot_discord.util.alttpr_discord import alttpr
 from alttprbot_discord.util.alttprdoors_discord import AlttprDoorDiscord
 
 
+# weightset path -> (mtime, CompiledWeightset), recompiled when the yaml file changes on disk
+WEIGHTSET_CACHE = {}
+
+
 class WeightsetNotFoundException(SahasrahBotException):
     pass
 
 
 async def generate_test_game(weightset='weighted', festive=False):
-    weights = await get_weights(weightset)
+    weights = await get_compiled_weights(weightset)
 
     if festive:
-        settings, _ = festive_generate_random_settings(weights=weights)
+        settings, _ = mysterydoors.generate_festive_mystery(weights=weights)
     else:
         settings, _, _ = mysterydoors.generate_doors_mystery(weights=weights)
 
@@ -30,21 +36,37 @@ async def generate_test_game(weightset='weighted', festive=False):
 
 
 async def get_weights(weightset='weighted'):
+    compiled = await get_compiled_weights(weightset)
+    # the cached dict is shared, and pyz3r edits the weights it's given
+    return copy.deepcopy(compiled.weights)
+
+
+async def get_compiled_weights(weightset='weighted'):
     basename = os.path.basename(f'{weightset}.yaml')
+    path = os.path.join("weights", basename)
 
     try:
-        async with aiofiles.open(os.path.join("weights", basename)) as f:
+        mtime = os.stat(path).st_mtime
+        cached = WEIGHTSET_CACHE.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        async with aiofiles.open(path) as f:
             weights = yaml.safe_load(await f.read())
     except FileNotFoundError as err:
         raise WeightsetNotFoundException(
             f'Could not find weightset {weightset}.  See a list of available weights at https://sahasrahbot.synack.live/mystery.html') from err
 
-    return weights
+    compiled = CompiledWeightset(weights)
+    WEIGHTSET_CACHE[path] = (mtime, compiled)
+    return compiled
 
 
 async def generate_random_game(weightset='weighted', weights=None, tournament=True, spoilers="off"):
     if weights is None:
-        weights = await get_weights(weightset)
+        weights = await get_compiled_weights(weightset)
+    elif not isinstance(weights, CompiledWeightset):
+        weights = CompiledWeightset(weights)
 
     if festive := weights.get('festive') and not await config.get(0, 'FestiveMode') == "true":
         raise WeightsetNotFoundException(
@@ -93,36 +115,18 @@ async def generate_random_game(weightset='weighted', weights=None, tournament=Tr
     return seed
 
 
-def festive_generate_random_settings(weights, tournament=True, spoilers="mystery"):
-    settings = {
-        "allow_quickswap": pyz3r.mystery.get_random_option(weights.get('allow_quickswap', False)),
-        "mode": pyz3r.mystery.get_random_option(weights['world_state']),
-        "item_placement": pyz3r.mystery.get_random_option(weights['item_placement']),
-        "dungeon_items": pyz3r.mystery.get_random_option(weights['dungeon_items']),
-        "accessibility": pyz3r.mystery.get_random_option(weights['accessibility']),
-        "hints": pyz3r.mystery.get_random_option(weights['hints']),
-        "weapons": pyz3r.mystery.get_random_option(weights['weapons']),
-        "item": {
-            "pool": pyz3r.mystery.get_random_option(weights['item_pool']),
-            "functionality": pyz3r.mystery.get_random_option(weights['item_functionality']),
-        },
-        "tournament": tournament,
-        "spoilers": spoilers,
-        "lang": "en"
-    }
-
-    return settings, False
-
-
-async def generate(weights, festive=False, spoilers="mystery"):
+async def generate(weights, festive=False, spoilers="mystery", rng=random):
+    if not isinstance(weights, CompiledWeightset):
+        weights = CompiledWeightset(weights)
+
     if festive:
-        settings, customizer = festive_generate_random_settings(
-            weights=weights, spoilers=spoilers)
+        settings, customizer = mysterydoors.generate_festive_mystery(weights=weights, spoilers=spoilers, rng=rng)
+        doors = False
     else:
         if 'preset' in weights:
-            rolledpreset = pyz3r.mystery.get_random_option(weights['preset'])
+            rolledpreset = weights.roll('preset', rng=rng)
             if rolledpreset == 'none':
-                settings, customizer, doors = mysterydoors.generate_doors_mystery(weights=weights, spoilers=spoilers) # pylint: disable=unbalanced-tuple-unpacking
+                settings, customizer, doors = mysterydoors.generate_doors_mystery(weights=weights, spoilers=spoilers, rng=rng) # pylint: disable=unbalanced-tuple-unpacking
             else:
                 preset_dict = await fetch_preset(rolledpreset, randomizer='alttpr')
                 settings = preset_dict['settings']
@@ -132,6 +136,6 @@ async def generate(weights, festive=False, spoilers="mystery"):
                 settings.pop('notes', None)
                 settings['spoilers'] = spoilers
         else:
-            settings, customizer, doors = mysterydoors.generate_doors_mystery(weights=weights, spoilers=spoilers) # pylint: disable=unbalanced-tuple-unpacking
+            settings, customizer, doors = mysterydoors.generate_doors_mystery(weights=weights, spoilers=spoilers, rng=rng) # pylint: disable=unbalanced-tuple-unpacking
 
     return settings, customizer, doors
@@ -0,0 +1,280 @@
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import logging
+import os
+import pickle
+import random
+import sys
+
+from alttprbot.alttprgen.randomizer import mysterydoors
+from alttprbot.alttprgen.weightsampler import CompiledWeightset
+from alttprbot.exceptions import SahasrahBotException
+
+# on one core a roll costs about 50us for weighted and 200us for chaos, so the default takes roughly 5 and 20 seconds
+ANALYZER_DEFAULT_ROLLS = 100000
+ANALYZER_MAX_ROLLS = 200000
+
+# rolls are split into chunks this size, and the chunks spread over up to this many processes
+ANALYZER_CHUNK_ROLLS = 10000
+ANALYZER_WORKERS = int(os.environ.get('ANALYZER_WORKERS', '2'))
+
+MISSING = object()
+
+# settings reported together by default, across the pyz3r, door and festive payloads
+COMBINATION_KEYS = [
+    'preset', 'doors', 'customizer', 'glitches', 'mode', 'goal', 'weapons', 'swords', 'dungeon_items',
+    'item_placement', 'entrances', 'shuffle', 'door_shuffle',
+]
+
+
+def roll_settings(weights: CompiledWeightset, rng=random):
+    """
+    Roll one settings dictionary the same way mystery.generate does, without generating a game.
+
+    Presets are not loaded, the rolled preset name is reported as its own setting instead.
+    """
+    if weights.get('festive', False):
+        settings, customizer = mysterydoors.generate_festive_mystery(weights=weights, spoilers="mystery", rng=rng)
+        return settings, customizer, False
+
+    if 'preset' in weights:
+        rolledpreset = weights.roll('preset', rng=rng)
+        if rolledpreset != 'none':
+            return {'preset': rolledpreset}, False, False
+
+    return mysterydoors.generate_doors_mystery(weights=weights, spoilers="mystery", rng=rng)
+
+
+class SettingsCounter():
+    """
+    Counts how often each value of each setting comes up over many rolls, by the path of keys to the dictionary it's
+    in.  This runs for every roll and a customizer payload has a couple hundred values, so each dictionary is counted
+    with one Counter.update rather than value by value, and one that's the same as the first seen at its path (the
+    drop tables, usually the item pool) is only tallied and added in at the end.
+    """
+
+    def __init__(self):
+        self.counts = collections.defaultdict(collections.Counter)
+        self.references = {}
+        self.unchanged = collections.Counter()
+        # path and keys of a dictionary -> its keys holding dicts or lists, most rolls come out the same shape
+        self.shapes = {}
+
+    def count(self, settings, path=()):
+        shape = (path, frozenset(settings))
+        nested = self.shapes.get(shape)
+        if nested is None:
+            nested = self.shapes[shape] = [key for key, value in settings.items() if isinstance(value, (dict, list))]
+
+        scalars = settings
+        if nested:
+            scalars = settings.copy()
+            for key in nested:
+                del scalars[key]
+        try:
+            hash(tuple(scalars.values()))
+        except TypeError:
+            # a rolled value that's a list where it usually isn't
+            nested = [key for key, value in settings.items() if isinstance(value, (dict, list))]
+            scalars = {key: value for key, value in settings.items() if key not in nested}
+
+        counter = self.counts[path]
+        counter.update(scalars.items())
+        for key in nested:
+            value = settings[key]
+            if isinstance(value, dict):
+                child = path + (key,)
+                if value == self.references.setdefault(child, value):
+                    self.unchanged[child] += 1
+                else:
+                    self.count(value, child)
+            elif isinstance(value, list):
+                counter[(key, tuple(value))] += 1
+            else:
+                counter[(key, value)] += 1
+
+    def pairs(self):
+        """
+        How often each (dotted setting name, value) came up.
+        """
+        counts = collections.defaultdict(collections.Counter)
+        for path, counter in self.counts.items():
+            counts[path].update(counter)
+        for path, count in self.unchanged.items():
+            add_settings(counts, self.references[path], path, count)
+
+        pairs = collections.Counter()
+        for path, counter in counts.items():
+            prefix = ''.join(f'{key}.' for key in path)
+            for (key, value), count in counter.items():
+                pairs[(f'{prefix}{key}', value)] = count
+        return pairs
+
+
+def add_settings(counts, settings, path, count):
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            add_settings(counts, value, path + (key,), count)
+        else:
+            counts[path][(key, tuple(value) if isinstance(value, list) else value)] += count
+
+
+def setting_value(settings, name, default=None):
+    """
+    Look up a setting by the dotted name it's reported under.  Keys can have dots in them too (custom.rom.timerMode),
+    so each place the name could be split is tried.
+    """
+    if name in settings:
+        return settings[name]
+    head, dot, rest = name.partition('.')
+    while dot:
+        value = settings.get(head)
+        if isinstance(value, dict):
+            found = setting_value(value, rest, default=MISSING)
+            if found is not MISSING:
+                return found
+        more, dot, rest = rest.partition('.')
+        head = f'{head}.{more}'
+    return default
+
+
+class WeightsetAnalysis():
+    def __init__(self, rolls, marginals, combinations, combination_keys):
+        self.rolls = rolls
+        self.marginals = marginals
+        self.combinations = combinations
+        self.combination_keys = combination_keys
+
+    def probability(self, key, value):
+        return self.marginals[key][value] / self.rolls
+
+    def report(self, top=10):
+        lines = [f'Weightset analysis of {self.rolls} rolls', '']
+
+        for key in sorted(self.marginals):
+            counter = self.marginals[key]
+            if len(counter) == 1:
+                continue
+            lines.append(key)
+            for value, count in counter.most_common():
+                lines.append(f'  {str(value):<30} {count / self.rolls:8.3%}')
+            lines.append('')
+
+        constant = sorted(k for k, c in self.marginals.items() if len(c) == 1)
+        if constant:
+            lines.append('Always the same')
+            for key in constant:
+                lines.append(f'  {key:<30} {next(iter(self.marginals[key]))}')
+            lines.append('')
+
+        if self.combination_keys:
+            lines.append(f"Most common combinations of {', '.join(self.combination_keys)}")
+            for combination, count in self.combinations.most_common(top):
+                lines.append(f"  {', '.join(str(v) for v in combination):<60} {count / self.rolls:8.3%}")
+            lines.append('')
+
+        return '\n'.join(lines)
+
+
+def analyze_chunk(weights, rolls, seed, combination_keys):
+    """
+    Roll a weightset rolls times.  Returns how often each (setting, value) pair came up, and how often each
+    combination of the combination_keys settings did.
+    """
+    if not isinstance(weights, CompiledWeightset):
+        weights = CompiledWeightset(weights)
+
+    rng = random.Random(seed)
+    counter = SettingsCounter()
+    combinations = collections.Counter()
+    for _ in range(rolls):
+        settings, customizer, doors = roll_settings(weights, rng=rng)
+        settings = {**settings, 'customizer': customizer, 'doors': doors}
+        # nearly every roll is different from every other, so count the values rather than whole rolls
+        counter.count(settings)
+        combinations[tuple(
+            settings[key] if key in settings else setting_value(settings, key) for key in combination_keys
+        )] += 1
+
+    return counter.pairs(), combinations
+
+
+def analyze_weightset(weights, rolls=ANALYZER_DEFAULT_ROLLS, seed=None, combination_keys=None, workers=1):
+    """
+    Roll a weightset many times and count how often each final setting comes up.
+
+    combination_keys picks the settings to report joint probabilities for.  If it isn't specified, the ones in
+    COMBINATION_KEYS that actually change between rolls are used.
+
+    Rolls are split into chunks of ANALYZER_CHUNK_ROLLS, each with its own seed drawn from seed, so the result for a
+    seed is the same however many worker processes the chunks are spread over.
+    """
+    if isinstance(weights, CompiledWeightset):
+        weights = weights.weights
+
+    keys = list(combination_keys or COMBINATION_KEYS)
+
+    rng = random.Random(seed)
+    chunks = [min(ANALYZER_CHUNK_ROLLS, rolls - start) for start in range(0, rolls, ANALYZER_CHUNK_ROLLS)]
+    seeds = [rng.getrandbits(64) for _ in chunks]
+
+    if workers > 1 and len(chunks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            results = list(pool.map(analyze_chunk, itertools.repeat(weights), chunks, seeds, itertools.repeat(keys)))
+    else:
+        compiled = CompiledWeightset(weights)
+        results = [analyze_chunk(compiled, chunk, chunk_seed, keys) for chunk, chunk_seed in zip(chunks, seeds)]
+
+    pairs = collections.Counter()
+    combinations = collections.Counter()
+    for chunk_pairs, chunk_combinations in results:
+        pairs.update(chunk_pairs)
+        combinations.update(chunk_combinations)
+
+    marginals = collections.defaultdict(collections.Counter)
+    for (key, value), count in pairs.items():
+        marginals[key][value] = count
+
+    if combination_keys is None:
+        # leave out the settings that are always the same (or never there), then add up what's left
+        varying = [i for i in range(len(keys)) if len(set(combination[i] for combination in combinations)) > 1]
+        keys = [keys[i] for i in varying]
+        projected = collections.Counter()
+        for combination, count in combinations.items():
+            projected[tuple(combination[i] for i in varying)] += count
+        combinations = projected
+
+    return WeightsetAnalysis(rolls, marginals, combinations, keys)
+
+
+async def analyze_weightset_in_process(weights, rolls=ANALYZER_DEFAULT_ROLLS, seed=None, combination_keys=None):
+    """
+    Run analyze_weightset in a separate python process (see mysteryanalyzer_worker.py), so hundreds of thousands of
+    rolls don't hold up the event loop.  The worker only imports the mystery code, not the bot.
+    """
+    if isinstance(weights, CompiledWeightset):
+        weights = weights.weights
+
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable,
+        '-m', 'alttprbot.alttprgen.mysteryanalyzer_worker',
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE)
+
+    job = {'weights': weights, 'rolls': rolls, 'seed': seed, 'combination_keys': combination_keys, 'workers': ANALYZER_WORKERS}
+    try:
+        stdout, stderr = await proc.communicate(pickle.dumps(job))
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+
+    if proc.returncode != 0:
+        logging.error(stderr.decode())
+        lines = stderr.decode().strip().splitlines()
+        raise SahasrahBotException(f"Unable to analyze weightset: {lines[-1] if lines else proc.returncode}")
+
+    return pickle.loads(stdout)
@@ -0,0 +1,27 @@
+"""
+One-shot weightset analysis, started by mysteryanalyzer.analyze_weightset_in_process with the bot's working directory.
+
+The job is read from stdin as a pickled dict of analyze_weightset's arguments, and the pickled WeightsetAnalysis is
+written to stdout.  Run as its own module so only the mystery code gets imported, not the bot.
+
+Anything printed while importing or rolling goes to stderr, so it can't get mixed in with the result.
+"""
+import os
+import pickle
+import sys
+
+protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+from alttprbot.alttprgen.mysteryanalyzer import analyze_weightset  # nopep8
+
+
+def main():
+    job = pickle.load(sys.stdin.buffer)
+    analysis = analyze_weightset(**job)
+    protocol.write(pickle.dumps(analysis))
+    protocol.flush()
+
+
+if __name__ == '__main__':
+    main()
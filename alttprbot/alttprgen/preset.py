@@ -1,3 +1,4 @@
+import copy
 import os
 import random
 
@@ -5,6 +6,7 @@ import aiofiles
 import yaml
 
 import pyz3r
+from alttprbot.alttprgen import seedpool
 from alttprbot.database import audit, config
 from alttprbot.exceptions import SahasrahBotException
 from alttprbot_discord.util.alttpr_discord import alttpr
@@ -26,6 +28,10 @@ SMZ3_ENVIRONMENTS = {
 }
 
 
+# preset path -> (mtime, parsed preset), so we only parse a preset yaml again when it changes on disk
+PRESET_CACHE = {}
+
+
 class PresetNotFoundException(SahasrahBotException):
     pass
 
@@ -34,10 +40,38 @@ class PresetNotFoundException(SahasrahBotException):
 
 async def get_preset(preset, hints=False, nohints=False, spoilers="off", tournament=True, randomizer='alttpr', allow_quickswap=False):
     preset_dict = await fetch_preset(preset, randomizer)
-    seed = await generate_preset(preset_dict, preset=preset, hints=hints, nohints=nohints, spoilers=spoilers, tournament=tournament, allow_quickswap=allow_quickswap)
+    seed = await claim_pooled_seed(preset_dict, preset=preset, hints=hints, nohints=nohints, spoilers=spoilers, tournament=tournament, allow_quickswap=allow_quickswap)
+    if seed is None:
+        seed = await generate_preset(preset_dict, preset=preset, hints=hints, nohints=nohints, spoilers=spoilers, tournament=tournament, allow_quickswap=allow_quickswap)
     return seed, preset_dict
 
 
+async def claim_pooled_seed(preset_dict, preset, **options):
+    # only plain alttpr seeds can be pooled, since we can rebuild them from just the hash
+    if preset_dict.get('randomizer', 'alttpr') != 'alttpr' or preset_dict.get('doors', False) or preset_dict.get('festive', False):
+        return None
+
+    pool = seedpool.get_pool(preset, seedpool.pool_variant(**options))
+    if pool is None:
+        return None
+
+    pooled = await pool.claim()
+    if pooled is None:
+        return None
+
+    return await alttpr(hash_id=pooled['hash_id'])
+
+
+async def generate_pooled_seed(preset, variant):
+    preset_dict = await fetch_preset(preset, 'alttpr')
+    return await generate_preset(preset_dict, preset=preset, **seedpool.variant_options(variant))
+
+
+def start_seed_pools(loop):
+    for pool in seedpool.POOLS.values():
+        loop.create_task(pool.run(generate=generate_pooled_seed))
+
+
 async def fetch_preset(preset, randomizer='alttpr'):
     preset = preset.lower()
 
@@ -45,8 +79,7 @@ async def fetch_preset(preset, randomizer='alttpr'):
     basename = os.path.basename(f'{preset}.yaml')
 
     try:
-        async with aiofiles.open(os.path.join(f"presets/{randomizer}", basename)) as f:
-            preset_dict = yaml.safe_load(await f.read())
+        preset_dict = await load_preset(os.path.join(f"presets/{randomizer}", basename))
         if preset_dict.get('festive') and not await config.get(0, 'FestiveMode') == "true":
             raise PresetNotFoundException(
                 f'Could not find preset {preset}.  See a list of available presets at https://sahasrahbot.synack.live/presets.html')
@@ -54,9 +87,32 @@ async def fetch_preset(preset, randomizer='alttpr'):
         raise PresetNotFoundException(
             f'Could not find preset {preset}.  See a list of available presets at https://sahasrahbot.synack.live/presets.html') from err
 
+    # generate_preset modifies the settings in place, so callers always get their own copy
+    return copy.deepcopy(preset_dict)
+
+
+async def load_preset(path):
+    mtime = os.stat(path).st_mtime
+    cached = PRESET_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    async with aiofiles.open(path) as f:
+        preset_dict = yaml.safe_load(await f.read())
+
+    PRESET_CACHE[path] = (mtime, preset_dict)
     return preset_dict
 
 
+async def load_all_presets():
+    for randomizer in os.listdir('presets'):
+        if not os.path.isdir(os.path.join('presets', randomizer)):
+            continue
+        for filename in os.listdir(os.path.join('presets', randomizer)):
+            if filename.endswith('.yaml'):
+                await load_preset(os.path.join('presets', randomizer, filename))
+
+
 async def generate_preset(preset_dict, preset=None, hints=False, nohints=False, spoilers="off", tournament=True, allow_quickswap=False):
     randomizer = preset_dict.get('randomizer', 'alttpr')
     settings = preset_dict['settings']
@@ -73,7 +129,8 @@ async def generate_preset(preset_dict, preset=None, hints=False, nohints=False,
 
             seed = await AlttprDoorDiscord.create(
                 settings=settings,
-                spoilers=spoilers == "on"
+                spoilers=spoilers == "on",
+                speculative_attempts=preset_dict.get('speculative_attempts')
             )
             hash_id = seed.hash
         else:
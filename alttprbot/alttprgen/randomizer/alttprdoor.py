@@ -5,120 +5,352 @@ import json
 import os
 import random
 import re
+import signal
 import string
-import tempfile
 import logging
 
-import aioboto3
-import aiofiles
-from tenacity import RetryError, AsyncRetrying, stop_after_attempt, retry_if_exception_type
+from alttprbot.exceptions import SahasrahBotException
+from alttprbot.util import bps, scratch, storage
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alttprdoor_worker.py')
+
+# how long a worker gets to answer after its job is cancelled before it's killed instead
+DOOR_WORKER_CANCEL_TIMEOUT = int(os.environ.get('DOOR_WORKER_CANCEL_TIMEOUT', '10'))
+
+
+class DoorWorkerPoolBusy(SahasrahBotException):
+    pass
+
+
+class DoorWorker():
+    """
+    A python process that has already imported the door randomizer, see alttprdoor_worker.py
+    """
+
+    def __init__(self):
+        self.proc = None
+        self.jobs = 0
+        self.log_task = None
+        self.stopped = False
+        # a job was cancelled and its answer hasn't been read yet
+        self.interrupted = False
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            'python3',
+            WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=os.environ.get('DOOR_RANDO_HOME'))
+        self.log_task = asyncio.create_task(self._log_output())
+
+    async def _log_output(self):
+        # the randomizer's own output, this has to be drained so the worker never blocks on a full pipe
+        async for line in self.proc.stderr:
+            logging.info(line.decode().rstrip())
+
+    @property
+    def alive(self):
+        # stopped as well, a stop cancelled while waiting for the kill to be reaped still leaves a dead worker
+        return self.proc is not None and self.proc.returncode is None and not self.stopped
+
+    async def run(self, settings_file_path, timeout):
+        self.jobs += 1
+        try:
+            self.proc.stdin.write((json.dumps({'settingsfile': settings_file_path}) + '\n').encode())
+            await self.proc.stdin.drain()
+            line = await asyncio.wait_for(self.proc.stdout.readline(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise Exception(f'Door randomizer did not finish within {timeout} seconds.')
+        except asyncio.CancelledError:
+            # the whole request is handed to the pipe by write(), so the worker is running the job or about to, ask it
+            # to abandon the job and leave reading the answer to reclaim()
+            if self.alive:
+                self.interrupted = True
+                self.proc.send_signal(signal.SIGINT)
+            raise
+        except BaseException:
+            # a broken pipe, or anything else that leaves the worker in an unknown state
+            await self.stop()
+            raise
+
+        if not line:
+            await self.stop()
+            raise Exception('Door randomizer worker exited unexpectedly.')
+
+        result = json.loads(line)
+        if not result['success']:
+            raise Exception(f"Exception while generating game: {result['error']}")
+
+    async def reclaim(self, timeout):
+        """
+        Read the answer to a cancelled job, so the worker can take another.  It's stopped if the answer doesn't come.
+        """
+        try:
+            line = await asyncio.wait_for(self.proc.stdout.readline(), timeout=timeout)
+        except BaseException:
+            await self.stop()
+            raise
+        if not line:
+            await self.stop()
+        self.interrupted = False
+
+    async def stop(self):
+        if self.alive:
+            self.stopped = True
+            self.proc.kill()
+            await self.proc.wait()
+        if self.log_task:
+            self.log_task.cancel()
+
+
+class DoorWorkerPool():
+    """
+    A fixed number of DoorWorkers that jobs take turns on.  Workers are replaced after max_jobs jobs (or if they time out
+    or die), and no more than max_queue jobs are allowed to wait for a free worker.
+
+    Each slot in idle holds a worker, or None if it needs a new one.  A slot is always given back, even if starting its
+    worker failed, and it's started again the next time it's taken, so a failure can't shrink the pool.
+    """
+
+    def __init__(self, size, max_jobs, timeout, max_queue):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.max_queue = max_queue
+
+        self.idle = None
+        self.waiting = 0
+        self.reclaiming = set()
+
+    async def _spawn(self):
+        worker = DoorWorker()
+        await worker.start()
+        return worker
+
+    async def _release(self, worker):
+        try:
+            if worker is not None and (not worker.alive or worker.jobs >= self.max_jobs):
+                await worker.stop()
+        finally:
+            self.idle.put_nowait(worker if worker is not None and worker.alive else None)
+
+    async def _reclaim(self, worker):
+        try:
+            await worker.reclaim(timeout=DOOR_WORKER_CANCEL_TIMEOUT)
+        except Exception:
+            logging.exception('Unable to reclaim door randomizer worker')
+        finally:
+            await self._release(worker)
+
+    async def generate(self, settings_file_path):
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+            for _ in range(self.size):
+                self.idle.put_nowait(None)
+
+        if self.waiting >= self.max_queue:
+            raise DoorWorkerPoolBusy('The door randomizer is too busy right now, please try again in a few minutes.')
+
+        self.waiting += 1
+        try:
+            worker = await self.idle.get()
+        finally:
+            self.waiting -= 1
+
+        try:
+            if worker is None or not worker.alive:
+                if worker is not None:
+                    await worker.stop()
+                worker = await self._spawn()
+            await worker.run(settings_file_path, timeout=self.timeout)
+        finally:
+            if worker is not None and worker.interrupted:
+                # whoever cancelled this shouldn't have to wait on the worker, the slot comes back once it answers
+                task = asyncio.create_task(self._reclaim(worker))
+                self.reclaiming.add(task)
+                task.add_done_callback(self.reclaiming.discard)
+            else:
+                await self._release(worker)
+
+
+class CpuBudget():
+    """
+    Caps how many door randomizer attempts run at once across every in-flight generation.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.in_use = 0
+        self.condition = None
+
+    async def acquire(self, wanted):
+        """
+        Wait until at least one slot is free, then take up to wanted slots.  Returns the number of slots taken.
+        """
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_use < self.total)
+            granted = min(wanted, self.total - self.in_use)
+            self.in_use += granted
+            return granted
+
+    async def release(self, count):
+        async with self.condition:
+            self.in_use -= count
+            self.condition.notify_all()
+
+
+DOOR_WORKER_POOL = DoorWorkerPool(
+    size=int(os.environ.get('DOOR_WORKERS', '2')),
+    max_jobs=int(os.environ.get('DOOR_WORKER_MAX_JOBS', '25')),
+    timeout=int(os.environ.get('DOOR_WORKER_TIMEOUT', '300')),
+    max_queue=int(os.environ.get('DOOR_WORKER_MAX_QUEUE', '20')),
+)
+
+DOOR_CPU_BUDGET = CpuBudget(int(os.environ.get('DOOR_CPU_BUDGET', DOOR_WORKER_POOL.size or os.cpu_count())))
+
+MAX_ATTEMPTS = 20
+
+
+async def run_door_randomizer(settings_file_path):
+    if DOOR_WORKER_POOL.size > 0:
+        await DOOR_WORKER_POOL.generate(settings_file_path)
+        return
+
+    proc = await asyncio.create_subprocess_exec(
+        'python3',
+        'DungeonRandomizer.py',
+        '--settingsfile', settings_file_path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=os.environ.get('DOOR_RANDO_HOME'))
+
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+
+    logging.info(stdout.decode())
+    if proc.returncode > 0:
+        raise Exception(f'Exception while generating game: {stderr.decode()}')
 
 
 class AlttprDoor():
-    def __init__(self, settings=None, spoilers=True):
+    def __init__(self, settings=None, spoilers=True, speculative_attempts=None):
         self.settings = settings
         self.spoilers = spoilers
+        if speculative_attempts is None:
+            speculative_attempts = int(os.environ.get('DOOR_SPECULATIVE_ATTEMPTS', '1'))
+        self.speculative_attempts = max(1, speculative_attempts)
 
-    async def generate_game(self):
-        with tempfile.TemporaryDirectory() as tmp:
-            settings_file_path = os.path.join(tmp, "settings.json")
-            self.hash = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
-
-            self.settings['outputpath'] = tmp
-            self.settings['outputname'] = self.hash
-            self.settings['create_rom'] = True
-            self.settings['create_spoiler'] = True
-            self.settings['calc_playthrough'] = False
-            self.settings['rom'] = os.environ.get('ALTTP_ROM')
-            self.settings['enemizercli'] = os.path.join(os.environ.get('ENEMIZER_HOME'), 'EnemizerCLI.Core')
-
-            # set some defaults we do NOT want to change ever
-            self.settings['count'] = 1
-            self.settings['multi'] = 1
-            self.settings['names'] = ""
-            self.settings['race'] = False
-
-            with open(settings_file_path, "w") as f:
-                json.dump(self.settings, f)
-
-            attempts = 0
+    async def _attempt(self, tmp, attempt_number):
+        # every attempt gets its own seed and output directory, since several of them may be running at once
+        attempt_path = os.path.join(tmp, f"attempt{attempt_number}")
+        os.mkdir(attempt_path)
+        settings_file_path = os.path.join(attempt_path, "settings.json")
+
+        with open(settings_file_path, "w") as f:
+            json.dump({**self.settings, 'outputpath': attempt_path, 'seed': random.randint(0, 999999999)}, f)
+
+        await run_door_randomizer(settings_file_path)
+        return attempt_path
+
+    async def _generate_attempts(self, tmp):
+        """
+        Run up to MAX_ATTEMPTS attempts, speculative_attempts at a time (or fewer if the CPU budget is tight), and
+        return the output directory of the first one to succeed.
+        """
+        attempts = 0
+        last_exception = None
+        while attempts < MAX_ATTEMPTS:
+            granted = await DOOR_CPU_BUDGET.acquire(min(self.speculative_attempts, MAX_ATTEMPTS - attempts))
+            tasks = [asyncio.create_task(self._attempt(tmp, attempts + i)) for i in range(granted)]
+            attempts += granted
             try:
-                async for attempt in AsyncRetrying(stop=stop_after_attempt(20), retry=retry_if_exception_type(Exception)):
-                    with attempt:
-                        attempts += 1
-                        proc = await asyncio.create_subprocess_exec(
-                            'python3',
-                            'DungeonRandomizer.py',
-                            '--settingsfile', settings_file_path,
-                            stdout=asyncio.subprocess.PIPE,
-                            stderr=asyncio.subprocess.PIPE,
-                            cwd=os.environ.get('DOOR_RANDO_HOME'))
-
-                        stdout, stderr = await proc.communicate()
-                        logging.info(stdout.decode())
-                        if proc.returncode > 0:
-                            raise Exception(f'Exception while generating game: {stderr.decode()}')
-
-            except RetryError as e:
-                raise e.last_attempt._exception from e
-
-            self.attempts = attempts
-
-            self.patch_name = "DR_" + self.settings['outputname'] + ".bps"
-            self.rom_name = "DR_" + self.settings['outputname'] + ".sfc"
-            self.spoiler_name = "DR_" + self.settings['outputname'] + "_Spoiler.txt"
-
-            rom_path = os.path.join(tmp, self.rom_name)
-            patch_path = os.path.join(tmp, self.patch_name)
-            spoiler_path = os.path.join(tmp, self.spoiler_name)
-
-            proc = await asyncio.create_subprocess_exec(
-                os.path.join('utils', 'flips'),
-                '--create',
-                '--bps-delta',
-                os.environ.get("ALTTP_ROM"),
-                rom_path,
-                patch_path,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE)
-
-            stdout, stderr = await proc.communicate()
-            logging.info(stdout.decode())
-            if proc.returncode > 0:
-                raise Exception(f'Exception while while creating patch: {stderr.decode()}')
-
-            async with aiofiles.open(patch_path, "rb") as f:
-                patchfile = await f.read()
-
-            async with aioboto3.client('s3') as s3:
-                await s3.put_object(
-                    Bucket=os.environ.get('SAHASRAHBOT_BUCKET'),
-                    Key=f"patch/{self.patch_name}",
-                    Body=patchfile,
-                    ACL='public-read'
-                )
-
-
-            async with aiofiles.open(spoiler_path, "rb") as f:
-                self.spoilerfile = await f.read()
-
-            async with aioboto3.client('s3') as s3:
-                await s3.put_object(
-                    Bucket=os.environ.get('SAHASRAHBOT_BUCKET'),
-                    Key=f"spoiler/{self.spoiler_name}",
-                    Body=gzip.compress(self.spoilerfile),
-                    ACL='public-read' if self.spoilers else 'private',
-                    ContentEncoding='gzip',
-                    ContentDisposition='attachment'
-                )
+                for task in asyncio.as_completed(tasks):
+                    try:
+                        output_path = await task
+                    except DoorWorkerPoolBusy:
+                        raise
+                    except Exception as e:
+                        last_exception = e
+                        continue
+                    self.attempts = attempts
+                    return output_path
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await DOOR_CPU_BUDGET.release(granted)
+
+        raise last_exception
+
+    async def generate_game(self):
+        self.hash = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
+
+        self.settings['outputname'] = self.hash
+        self.settings['create_rom'] = True
+        self.settings['create_spoiler'] = True
+        self.settings['calc_playthrough'] = False
+        self.settings['rom'] = os.environ.get('ALTTP_ROM')
+        self.settings['enemizercli'] = os.path.join(os.environ.get('ENEMIZER_HOME'), 'EnemizerCLI.Core')
+
+        # set some defaults we do NOT want to change ever
+        self.settings['count'] = 1
+        self.settings['multi'] = 1
+        self.settings['names'] = ""
+        self.settings['race'] = False
+
+        self.patch_name = "DR_" + self.settings['outputname'] + ".bps"
+        self.rom_name = "DR_" + self.settings['outputname'] + ".sfc"
+        self.spoiler_name = "DR_" + self.settings['outputname'] + "_Spoiler.txt"
+
+        # the door randomizer can only hand us files, so let it write them to the scratch area (a tmpfs if we have one)
+        # and pull them into memory as soon as it's done, everything after this works on the buffers
+        with scratch.scratch_directory() as tmp:
+            output_path = await self._generate_attempts(tmp)
+
+            with open(os.path.join(output_path, self.rom_name), "rb") as f:
+                rom = f.read()
+
+            with open(os.path.join(output_path, self.spoiler_name), "rb") as f:
+                self.spoilerfile = f.read()
+
+        patchfile = await bps.create_patch_async(os.environ.get("ALTTP_ROM"), rom)
+        del rom
+
+        await storage.put_objects(
+            dict(
+                bucket=os.environ.get('SAHASRAHBOT_BUCKET'),
+                key=f"patch/{self.patch_name}",
+                body=patchfile,
+                ACL='public-read'
+            ),
+            dict(
+                bucket=os.environ.get('SAHASRAHBOT_BUCKET'),
+                key=f"spoiler/{self.spoiler_name}",
+                body=gzip.compress(self.spoilerfile),
+                ACL='public-read' if self.spoilers else 'private',
+                ContentEncoding='gzip',
+                ContentDisposition='attachment'
+            ),
+        )
 
     @classmethod
     async def create(
         cls,
         settings,
-        spoilers=True
+        spoilers=True,
+        speculative_attempts=None
     ):
-        seed = cls(settings=settings, spoilers=spoilers)
+        seed = cls(settings=settings, spoilers=spoilers, speculative_attempts=speculative_attempts)
         await seed.generate_game()
         return seed
 
@@ -0,0 +1,72 @@
+"""
+Long-lived door randomizer worker, started by alttprdoor.DoorWorkerPool with DOOR_RANDO_HOME as its working directory.
+
+The door randomizer is imported once, then each line on stdin is a JSON job ({"settingsfile": "..."}) and each
+job gets exactly one JSON line back ({"success": true} or {"success": false, "error": "..."}).
+
+SIGINT abandons the job that's running, if there is one, and it's answered like any other failed job, so the pool can
+give the worker another one instead of starting a new process.
+
+Anything the randomizer prints goes to stderr, so it can't get mixed in with the responses.
+"""
+import json
+import os
+import signal
+import sys
+import traceback
+
+protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+sys.path.insert(0, os.getcwd())
+
+import DungeonRandomizer  # pylint: disable=import-error
+
+running = False
+
+
+class JobCancelled(BaseException):
+    # not an Exception, so nothing in the randomizer catches it
+    pass
+
+
+def cancel(signum, frame):
+    global running
+    # only once per job, and never between jobs
+    if running:
+        running = False
+        raise JobCancelled()
+
+
+def run_job(job):
+    sys.argv = ['DungeonRandomizer.py', '--settingsfile', job['settingsfile']]
+    try:
+        DungeonRandomizer.start()
+    except SystemExit as e:
+        if e.code:
+            return {'success': False, 'error': f'Door randomizer exited with {e.code}'}
+    except Exception:
+        return {'success': False, 'error': traceback.format_exc()}
+    return {'success': True}
+
+
+def main():
+    global running
+    signal.signal(signal.SIGINT, cancel)
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            running = True
+            result = run_job(json.loads(line))
+        except JobCancelled:
+            result = {'success': False, 'error': 'Cancelled'}
+        finally:
+            running = False
+        sys.stdout.flush()
+        protocol.write(json.dumps(result) + '\n')
+        protocol.flush()
+
+
+if __name__ == '__main__':
+    main()
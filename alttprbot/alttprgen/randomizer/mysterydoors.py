@@ -1,7 +1,9 @@
-import copy
-import logging
+import random
 
-from pyz3r.mystery import get_random_option, generate_random_settings
+from pyz3r.customizer import BASE_CUSTOMIZER_PAYLOAD, get_starting_equipment
+from pyz3r.mystery import BASE_RANDOMIZER_PAYLOAD
+
+from alttprbot.alttprgen.weightsampler import CompiledWeightset, compile_option, roll_option
 
 BASE_DOORS_PAYLOAD = {
     "retro": False,
@@ -40,27 +42,27 @@ BASE_DOORS_PAYLOAD = {
 }
 
 
-def generate_doors_settings(weights, options):
-    options["glitches"] = get_random_option(weights['glitches_required'])
-    options["dungeon_items"] = get_random_option(weights['dungeon_items'])
-    options["accessibility"] = get_random_option(weights['accessibility'])
-    options["goals"] = get_random_option(weights['goals'])
-    options["ganon_open"] = get_random_option(weights['ganon_open'])
-    options["tower_open"] = get_random_option(weights['tower_open'])
-    options["world_state"] = get_random_option(weights['world_state'])
-    options["hints"] = get_random_option(weights['hints'])
-    options["weapons"] = get_random_option(weights['weapons'])
-    options["item_pool"] = get_random_option(weights['item_pool'])
-    options["item_functionality"] = get_random_option(weights['item_functionality'])
-    options["boss_shuffle"] = get_random_option(weights['boss_shuffle'])
-    options["enemy_shuffle"] = get_random_option(weights['enemy_shuffle'])
-    options["enemy_damage"] = get_random_option(weights['enemy_damage'])
-    options["enemy_health"] = get_random_option(weights['enemy_health'])
-    options["pot_shuffle"] = get_random_option(weights.get('pot_shuffle', 'off'))
-    options['entrance_shuffle'] = get_random_option(weights['entrance_shuffle'])
-
-    options['intensity'] = get_random_option(weights.get('intensity', 2))
-    options['beemizer'] = get_random_option(weights.get('beemizer', 0))
+def generate_doors_settings(weights, options, rng=random):
+    options["glitches"] = weights.roll('glitches_required', rng=rng)
+    options["dungeon_items"] = weights.roll('dungeon_items', rng=rng)
+    options["accessibility"] = weights.roll('accessibility', rng=rng)
+    options["goals"] = weights.roll('goals', rng=rng)
+    options["ganon_open"] = weights.roll('ganon_open', rng=rng)
+    options["tower_open"] = weights.roll('tower_open', rng=rng)
+    options["world_state"] = weights.roll('world_state', rng=rng)
+    options["hints"] = weights.roll('hints', rng=rng)
+    options["weapons"] = weights.roll('weapons', rng=rng)
+    options["item_pool"] = weights.roll('item_pool', rng=rng)
+    options["item_functionality"] = weights.roll('item_functionality', rng=rng)
+    options["boss_shuffle"] = weights.roll('boss_shuffle', rng=rng)
+    options["enemy_shuffle"] = weights.roll('enemy_shuffle', rng=rng)
+    options["enemy_damage"] = weights.roll('enemy_damage', rng=rng)
+    options["enemy_health"] = weights.roll('enemy_health', rng=rng)
+    options["pot_shuffle"] = weights.roll('pot_shuffle', 'off', rng=rng)
+    options['entrance_shuffle'] = weights.roll('entrance_shuffle', rng=rng)
+
+    options['intensity'] = weights.roll('intensity', 2, rng=rng)
+    options['beemizer'] = weights.roll('beemizer', 0, rng=rng)
 
     # This if statement is dedicated to the survivors of http://www.speedrunslive.com/races/result/#!/264658
     # Play https://alttpr.com/en/h/30yAqZ99yV if you don't believe me. <3
@@ -71,10 +73,7 @@ def generate_doors_settings(weights, options):
         options['weapons'] = 'assured'
 
     # apply rules
-    for rule in weights.get('rules', {}):
-        conditions = rule.get('conditions', {})
-        actions = rule.get('actions', {})
-
+    for conditions, actions in weights.rules:
         # iterate through each condition
         match = True
 
@@ -87,9 +86,10 @@ def generate_doors_settings(weights, options):
 
         if match:
             for key, value in actions.items():
-                options[key] = get_random_option(value)
+                options[key] = roll_option(value, rng)
 
-    settings = copy.deepcopy(BASE_DOORS_PAYLOAD)
+    # startinventoryarray is the only mutable value in the payload, so a shallow copy is enough (and much faster than deepcopy)
+    settings = {**BASE_DOORS_PAYLOAD, 'startinventoryarray': {}}
 
     settings["retro"] = options['world_state'] == 'retro'
     settings["mode"] = "open" if options['world_state'] == 'retro' else options['world_state']
@@ -143,30 +143,297 @@ def generate_doors_settings(weights, options):
     return settings
 
 
-def generate_doors_mystery(weights, tournament=True, spoilers="mystery"):
-    while True:
-        subweight_name = get_random_option(
-            {k: v['chance'] for (k, v) in weights.get('subweights', {}).items()})
-
-        logging.info(f"{subweight_name=}")
-
-        if subweight_name is None:
-            break
+def generate_doors_mystery(weights, tournament=True, spoilers="mystery", rng=random):
+    if not isinstance(weights, CompiledWeightset):
+        weights = CompiledWeightset(weights)
 
-        subweights = weights.get('subweights', {}).get(subweight_name, {}).get('weights', {})
-        subweights['subweights'] = subweights.get('subweights', {})
-        weights = {**weights, **subweights}
+    weights = weights.roll_subweights(rng)
 
     options = {}
-    options['door_shuffle'] = get_random_option(weights.get('door_shuffle', 'vanilla'))
-    options['keydropshuffle'] = get_random_option(weights.get('keydropshuffle', False))
+    options['door_shuffle'] = weights.roll('door_shuffle', 'vanilla', rng=rng)
+    options['keydropshuffle'] = weights.roll('keydropshuffle', False, rng=rng)
 
     doors = options['door_shuffle'] != 'vanilla'
     keydropshuffle = options['keydropshuffle']
 
     if doors or keydropshuffle:
-        settings = generate_doors_settings(weights, options)
+        settings = generate_doors_settings(weights, options, rng=rng)
         return settings, False, True
 
-    settings, customizer = generate_random_settings(weights, tournament=tournament, spoilers=spoilers)
+    settings, customizer = generate_random_settings(weights, tournament=tournament, spoilers=spoilers, rng=rng)
     return settings, customizer, False
+
+
+def generate_random_settings(weights, tournament=True, spoilers="mystery", rng=random):
+    """
+    pyz3r.mystery.generate_random_settings, rolled from a CompiledWeightset with subweights already resolved.
+
+    Unlike pyz3r this doesn't edit the weights (they're cached and shared by every roll), and rolls against rng
+    instead of the global random module.
+    """
+    # customizer isn't used until its used
+    customizer = False
+
+    options = {}
+
+    options["glitches"] = weights.roll('glitches_required', rng=rng)
+    options["item_placement"] = weights.roll('item_placement', rng=rng)
+    options["dungeon_items"] = weights.roll('dungeon_items', rng=rng)
+    options["accessibility"] = weights.roll('accessibility', rng=rng)
+    options["goals"] = weights.roll('goals', rng=rng)
+    options["ganon_open"] = weights.roll('ganon_open', rng=rng)
+    options["tower_open"] = weights.roll('tower_open', rng=rng)
+    options["world_state"] = weights.roll('world_state', rng=rng)
+    options["hints"] = weights.roll('hints', rng=rng)
+    options["weapons"] = weights.roll('weapons', rng=rng)
+    options["item_pool"] = weights.roll('item_pool', rng=rng)
+    options["item_functionality"] = weights.roll('item_functionality', rng=rng)
+    options["boss_shuffle"] = weights.roll('boss_shuffle', rng=rng)
+    options["enemy_shuffle"] = weights.roll('enemy_shuffle', rng=rng)
+    options["enemy_damage"] = weights.roll('enemy_damage', rng=rng)
+    options["enemy_health"] = weights.roll('enemy_health', rng=rng)
+    options["pot_shuffle"] = weights.roll('pot_shuffle', 'off', rng=rng)
+    options["pseudoboots"] = weights.roll('pseudoboots', False, rng=rng)
+    options['entrance_shuffle'] = weights.roll('entrance_shuffle', rng=rng)
+
+    # only roll customizer stuff if entrance shuffle isn't on, and we have a customizer section
+    if options['entrance_shuffle'] == "none" and weights.get('customizer', None):
+        custom = {}
+        eq = []
+        pool = {}
+
+        for key, optset in weights.customizer.get('eq', {}).items():
+            value = optset.sample(rng)
+            if value:
+                eq += get_starting_equipment(key=key, value=value)
+                customizer = True
+
+        for key, optset in weights.customizer.get('custom', {}).items():
+            value = optset.sample(rng)
+            if value is not None:
+                custom[key] = value
+                customizer = True
+
+        for key, optset in weights.customizer.get('pool', {}).items():
+            value = optset.sample(rng)
+            if value is not None:
+                pool[key] = value
+                customizer = True
+
+    if customizer:
+        settings = CUSTOMIZER_TEMPLATE.copy()
+    else:
+        settings = RANDOMIZER_TEMPLATE.copy()
+
+    if customizer:
+        apply_customizer(weights, options, settings, custom, eq, pool, rng)
+
+    # This if statement is dedicated to the survivors of http://www.speedrunslive.com/races/result/#!/264658
+    # Play https://alttpr.com/en/h/30yAqZ99yV if you don't believe me. <3
+    if options['weapons'] not in ['vanilla', 'assured'] and options['world_state'] == 'standard' and (
+            options['enemy_shuffle'] != 'none'
+            or options['enemy_damage'] != 'default'
+            or options['enemy_health'] != 'default'):
+        options['weapons'] = 'assured'
+
+    # apply rules
+    for conditions, actions in weights.rules:
+        # iterate through each condition
+        match = True
+
+        for condition in conditions:
+            if condition.get('MatchType', 'exact') == 'exact':
+                if options[condition['Key']] == condition['Value']:
+                    continue
+                else:
+                    match = False
+
+        if match:
+            for key, value in actions.items():
+                options[key] = roll_option(value, rng)
+
+    settings["glitches"] = options["glitches"]
+    settings["item_placement"] = options['item_placement']
+    settings["dungeon_items"] = options['dungeon_items']
+    settings["accessibility"] = options['accessibility']
+    settings["goal"] = options['goals']
+    settings["crystals"]["ganon"] = options['ganon_open']
+    settings["crystals"]["tower"] = options['tower_open']
+    settings["mode"] = options['world_state']
+    settings["hints"] = options['hints']
+    settings["weapons"] = options['weapons']
+    settings["item"]["pool"] = options['item_pool']
+    settings["item"]["functionality"] = options['item_functionality']
+    settings["tournament"] = tournament
+    settings["spoilers"] = spoilers
+    settings["enemizer"]["boss_shuffle"] = options['boss_shuffle']
+    settings["enemizer"]["enemy_shuffle"] = options['enemy_shuffle']
+    settings["enemizer"]["enemy_damage"] = options['enemy_damage']
+    settings["enemizer"]["enemy_health"] = options['enemy_health']
+    settings["enemizer"]["pot_shuffle"] = options.get('pot_shuffle', 'off')
+    settings["entrances"] = options['entrance_shuffle']
+    settings["pseudoboots"] = options['pseudoboots']
+
+    settings["allow_quickswap"] = weights.roll('allow_quickswap', False, rng=rng)
+
+    return settings, customizer
+
+
+def apply_customizer(weights, options, settings, custom, eq, pool, rng=random):
+    # default to v31 prize packs
+    settings['custom']['customPrizePacks'] = False
+
+    # set custom settings that were rolled
+    for key, value in custom.items():
+        settings['custom'][key] = value
+
+    # set custom item pool that was rolled
+    for key, value in pool.items():
+        settings['custom']['item']['count'][key] = value
+
+    # apply custom starting equipment, and adjust the item pool accordingly
+    if eq:
+        # remove items from pool
+        for item in eq:
+            # remove flute if starting with activated flute
+            # remove bottles as well
+            if item == 'OcarinaActive':
+                item = 'OcarinaInactive'
+            if item in ['Bottle', 'BottleWithRedPotion', 'BottleWithGreenPotion', 'BottleWithBluePotion', 'BottleWithBee', 'BottleWithGoldBee', 'BottleWithFairy']:
+                item = 'BottleWithRandom'
+
+            settings['custom']['item']['count'][item] = settings['custom']['item']['count'].get(
+                item, 0) - 1 if settings['custom']['item']['count'].get(item, 0) > 0 else 0
+
+        # re-add 3 heart containers as a baseline
+        eq += ['BossHeartContainer'] * 3
+
+        # update the eq section of the settings
+        settings['eq'] = eq
+
+    # if dark room navigation is enabled, then
+    # oh and yes item.require.Lamp is mixed around for whatever reason
+    # False = dark room navigation isn't required
+    if settings['custom'].get('item.require.Lamp', False):
+        options['enemy_shuffle'] = 'none'
+        options['enemy_damage'] = 'default'
+        options['pot_shuffle'] = 'off'
+
+    # set dungeon_items to standard if any region.wild* custom settings are present
+    if any(key in ['region.wildKeys', 'region.wildBigKeys', 'region.wildCompasses', 'region.wildMaps'] for key in custom):
+        options['dungeon_items'] = 'standard'
+
+    if settings['custom'].get('region.wildKeys', False) or settings['custom'].get('region.wildBigKeys', False) or settings['custom'].get('region.wildCompasses', False) or settings['custom'].get('region.wildMaps', False):
+        settings['custom']['rom.freeItemMenu'] = True
+        settings['custom']['rom.freeItemText'] = True
+
+    if settings['custom'].get('region.wildMaps', False) and 'rom.mapOnPickup' not in weights['customizer']['custom']:
+        settings['custom']['rom.mapOnPickup'] = True
+
+    if settings['custom'].get('region.wildCompasses', False) and 'rom.dungeonCount' not in weights['customizer']['custom']:
+        settings['custom']['rom.dungeonCount'] = 'pickup'
+
+    # set custom triforce hunt settings if TFH is the goal
+    if options['goals'] == 'triforce-hunt':
+        if 'triforce-hunt' in weights['customizer']:
+            triforce_hunt = weights['customizer']['triforce-hunt']
+            min_difference = roll_option(compile_option(triforce_hunt.get('min_difference', 0)), rng)
+            try:
+                goal_pieces = randval(triforce_hunt['goal'], rng)
+            except KeyError:
+                goal_pieces = 20
+
+            try:
+                pool_range = triforce_hunt['pool']
+                if isinstance(pool_range, list) and pool_range[0] + min_difference < goal_pieces:
+                    # pyz3r raises the bottom of the range in the weights themselves, this only does it for this roll
+                    pool_range = [goal_pieces + min_difference] + pool_range[1:]
+                pool_pieces = randval(pool_range, rng)
+
+                # a final catchall
+                if pool_pieces < goal_pieces + min_difference:
+                    pool_pieces = goal_pieces + min_difference
+            except KeyError:
+                pool_pieces = 30
+        else:
+            goal_pieces = 20
+            pool_pieces = 30
+
+        settings['custom']['item.Goal.Required'] = goal_pieces
+        settings['custom']['item']['count']['TriforcePiece'] = pool_pieces
+
+    if settings['custom'].get('rom.timerMode', 'off') == 'countdown-ohko':
+        if 'timed-ohko' in weights['customizer']:
+            timed_ohko = weights['customizer']['timed-ohko']
+            for clock in timed_ohko.get('clock', {}):
+                settings['custom'][f'item.value.{clock}'] = randval(timed_ohko['clock'][clock].get('value', 0), rng)
+                settings['custom']['item']['count'][clock] = randval(timed_ohko['clock'][clock].get('pool', 0), rng)
+
+            settings['custom']['rom.timerStart'] = randval(timed_ohko.get('timerStart', 0), rng)
+
+    # fill in empty items in pool with FillItemPoolWith option, defaults to "Nothing"
+    filler = weights.get('options', {}).get('FillItemPoolWith', 'Nothing')
+    settings['custom']['item']['count'][filler] = settings['custom']['item']['count'].get(
+        filler, 0) + max(0, 216 - sum(settings['custom']['item']['count'].values()))
+
+    # deactivate a starting flute that's pre-activated, as it'll cause some really dumb rainstate scenarios
+    if options["world_state"] == 'standard':
+        settings['eq'] = [item if item != 'OcarinaActive' else 'OcarinaInactive' for item in settings.get('eq', {})]
+
+    # fix a bad interaction between pedestal/dungeons goals and prize.crossWorld
+    if options["goals"] in ['pedestal', 'dungeons']:
+        settings['custom']['prize.crossWorld'] = True
+
+
+def randval(optset, rng=random):
+    if isinstance(optset, list):
+        return rng.randint(optset[0], optset[1])
+    return optset
+
+
+class PayloadTemplate():
+    """
+    Deep copies a payload made of dicts, lists and scalars.  Where the containers are is worked out once, so a copy
+    is one shallow copy per container instead of walking every value, which is what makes deepcopy (and the
+    customizer payload's couple hundred item counts) slow when rolling thousands of times.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+        keys = payload.keys() if isinstance(payload, dict) else range(len(payload))
+        self.children = [(key, PayloadTemplate(payload[key])) for key in keys if isinstance(payload[key], (dict, list))]
+
+    def copy(self):
+        copied = self.payload.copy()
+        for key, child in self.children:
+            copied[key] = child.copy()
+        return copied
+
+
+RANDOMIZER_TEMPLATE = PayloadTemplate(BASE_RANDOMIZER_PAYLOAD)
+CUSTOMIZER_TEMPLATE = PayloadTemplate(BASE_CUSTOMIZER_PAYLOAD)
+
+
+def generate_festive_mystery(weights, tournament=True, spoilers="mystery", rng=random):
+    if not isinstance(weights, CompiledWeightset):
+        weights = CompiledWeightset(weights)
+
+    settings = {
+        "allow_quickswap": weights.roll('allow_quickswap', False, rng=rng),
+        "mode": weights.roll('world_state', rng=rng),
+        "item_placement": weights.roll('item_placement', rng=rng),
+        "dungeon_items": weights.roll('dungeon_items', rng=rng),
+        "accessibility": weights.roll('accessibility', rng=rng),
+        "hints": weights.roll('hints', rng=rng),
+        "weapons": weights.roll('weapons', rng=rng),
+        "item": {
+            "pool": weights.roll('item_pool', rng=rng),
+            "functionality": weights.roll('item_functionality', rng=rng),
+        },
+        "tournament": tournament,
+        "spoilers": spoilers,
+        "lang": "en"
+    }
+
+    return settings, False
+
@@ -1,8 +1,10 @@
 import asyncio
 import os
 import random
-import tempfile
-import logging
+
+import aiofiles
+
+from alttprbot.util import bps, scratch
 
 ###
 # 1) Make a new temp directory
@@ -24,44 +26,31 @@ async def create_smdash(mode="mm"):
     if mode not in ['mm', 'full', 'sgl20', 'vanilla']:
         raise Exception("Specified mode is not valid.")
 
-    with tempfile.TemporaryDirectory() as tmp:
-        wd = os.getcwd()
-        os.chdir(tmp)
-        try:
-            proc = await asyncio.create_subprocess_exec(
-                'mono',
-                '/opt/dash-rando-app/dash-rando-app-v10/DASH_Randomizer.exe',
-                '-q',
-                '-v',
-                '-m', mode,
-                '-p', os.environ.get('SM_ROM'),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE)
-
-            _, stderr = await proc.communicate()
-            if proc.returncode > 0:
-                raise Exception(f'Exception while generating game: {stderr.decode()}')
-        finally:
-            os.chdir(wd)
+    with scratch.scratch_directory() as tmp:
+        proc = await asyncio.create_subprocess_exec(
+            'mono',
+            '/opt/dash-rando-app/dash-rando-app-v10/DASH_Randomizer.exe',
+            '-q',
+            '-v',
+            '-m', mode,
+            '-p', os.environ.get('SM_ROM'),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=tmp)
 
-        os.chdir(wd)
-        logging.info(os.getcwd())
+        _, stderr = await proc.communicate()
+        if proc.returncode > 0:
+            raise Exception(f'Exception while generating game: {stderr.decode()}')
 
         smdashrom = os.path.join(tmp, [f for f in os.listdir(tmp) if f.endswith(".sfc")][0])
         patchname = os.path.splitext(os.path.basename(smdashrom))[0] + ".bps"
 
-        proc = await asyncio.create_subprocess_exec(
-            os.path.join(wd, 'utils', 'flips'),
-            '--create',
-            '--bps-delta',
-            os.environ.get('SM_ROM'),
-            smdashrom,
-            os.path.join('/var/www/sgldash/bps', patchname),
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE)
+        with open(smdashrom, "rb") as f:
+            rom = f.read()
 
-        _, stderr = await proc.communicate()
-        if proc.returncode > 0:
-            raise Exception(f'Exception while while creating patch: {stderr.decode()}')
+    patch = await bps.create_patch_async(os.environ.get('SM_ROM'), rom)
+
+    async with aiofiles.open(os.path.join('/var/www/sgldash/bps', patchname), "wb") as f:
+        await f.write(patch)
 
     return f"https://patch.synack.live/?patch={patchname}"
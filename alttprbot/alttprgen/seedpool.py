@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import time
+
+from alttprbot.database import seed_pool
+
+# how long an idle pool waits before checking its depth again, in seconds
+REFILL_INTERVAL = 300
+
+
+def pool_variant(hints=False, nohints=False, spoilers="off", tournament=True, allow_quickswap=False):
+    """
+    Pooled seeds are only interchangeable if they were rolled with the same options, so each pool holds a single variant.
+    Returns None for options we never pool (anything that isn't a tournament seed without spoilers).
+    """
+    if spoilers != "off" or not tournament:
+        return None
+
+    if hints:
+        variant = 'hints'
+    elif nohints:
+        variant = 'nohints'
+    else:
+        variant = 'default'
+
+    if allow_quickswap:
+        variant += '+quickswap'
+
+    return variant
+
+
+def variant_options(variant):
+    base, _, quickswap = variant.partition('+')
+    return dict(
+        hints=base == 'hints',
+        nohints=base == 'nohints',
+        spoilers="off",
+        tournament=True,
+        allow_quickswap=quickswap == 'quickswap',
+    )
+
+
+class SeedPool():
+    def __init__(self, preset, variant, depth):
+        self.preset = preset
+        self.variant = variant
+        self.depth = depth
+
+        self.available = None
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_failures = 0
+        self.refill_seconds_total = 0.0
+        self.last_refill_seconds = None
+
+        self.wakeup = asyncio.Event()
+
+    async def claim(self):
+        result = await seed_pool.claim_seed(self.preset, self.variant)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.wakeup.set()
+        return result
+
+    async def run(self, generate):
+        """
+        Keep the pool topped up.  generate is a coroutine function that takes (preset, variant) and returns a new seed.
+        """
+        while True:
+            # clear before counting, so a claim that happens while we're refilling wakes us right back up
+            self.wakeup.clear()
+            try:
+                self.available = await seed_pool.count_available(self.preset, self.variant)
+                while self.available < self.depth:
+                    start = time.monotonic()
+                    seed = await generate(self.preset, self.variant)
+                    await seed_pool.insert_seed(
+                        randomizer='alttpr',
+                        preset=self.preset,
+                        variant=self.variant,
+                        hash_id=seed.hash,
+                        permalink=seed.url
+                    )
+                    self.last_refill_seconds = time.monotonic() - start
+                    self.refill_seconds_total += self.last_refill_seconds
+                    self.refills += 1
+                    self.available += 1
+            except Exception:
+                self.refill_failures += 1
+                logging.exception(f"Unable to refill seed pool {self.preset}/{self.variant}")
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=REFILL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    @property
+    def metrics(self):
+        claims = self.hits + self.misses
+        return dict(
+            preset=self.preset,
+            variant=self.variant,
+            depth=self.depth,
+            available=self.available,
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / claims if claims else None,
+            refills=self.refills,
+            refill_failures=self.refill_failures,
+            last_refill_seconds=self.last_refill_seconds,
+            average_refill_seconds=self.refill_seconds_total / self.refills if self.refills else None,
+        )
+
+
+def load_pools(config):
+    """
+    Parse the SEED_POOL_PRESETS environment variable, a comma separated list of preset/variant=depth
+    (eg. "tournament/nohints+quickswap=5,open=3").  The variant defaults to "default".
+    """
+    pools = {}
+    for entry in filter(None, [e.strip() for e in config.split(',')]):
+        name, _, depth = entry.partition('=')
+        preset, _, variant = name.partition('/')
+        variant = variant or 'default'
+        pools[(preset.lower(), variant)] = SeedPool(preset.lower(), variant, int(depth or 1))
+    return pools
+
+
+POOLS = load_pools(os.environ.get('SEED_POOL_PRESETS', ''))
+
+
+def get_pool(preset, variant):
+    if variant is None:
+        return None
+    return POOLS.get((preset.lower(), variant))
+
+
+def get_metrics():
+    return [pool.metrics for pool in POOLS.values()]
@@ -1,10 +1,8 @@
-import gzip
-import json
 import random
 import string
 import os
 
-import aioboto3
+from alttprbot.util import gzipjson, storage
 
 # from config import Config as c
 
@@ -37,16 +35,15 @@ async def write_json_to_disk(seed, spoiler_type='spoiler'):
     else:
         sorteddict = seed.get_formatted_spoiler(translate_dungeon_items=True)
 
-    payload = gzip.compress(json.dumps(sorteddict, indent=4).encode('utf-8'))
-
-    async with aioboto3.client('s3') as s3:
-        await s3.put_object(
-            Bucket=os.environ.get('AWS_SPOILER_BUCKET_NAME'),
-            Key=filename,
-            Body=payload,
-            ACL='public-read',
-            ContentEncoding='gzip',
-            ContentDisposition='attachment'
-        )
+    payload = await gzipjson.gzip_json_async(sorteddict)
+
+    await storage.STORAGE.put_object(
+        bucket=os.environ.get('AWS_SPOILER_BUCKET_NAME'),
+        key=filename,
+        body=payload,
+        ACL='public-read',
+        ContentEncoding='gzip',
+        ContentDisposition='attachment'
+    )
 
     return f"{os.environ.get('SpoilerLogUrlBase')}/{filename}"
@@ -0,0 +1,158 @@
+import random
+
+from pyz3r.mystery import conv
+
+MISSING = object()
+
+
+class AliasSampler():
+    """
+    Samples an option from a {option: weight} dictionary in constant time using Vose's alias method.
+    Behaves like pyz3r.mystery.get_random_option, but only normalizes the weights once.
+    """
+
+    def __init__(self, options: dict):
+        # keys are converted the same way pyz3r does, so "7" rolls as 7 and "true" as True
+        self.options = [conv(key) for key in options.keys()]
+        weights = [float(w) for w in options.values()]
+        self.total = sum(weights)
+
+        n = len(self.options)
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+
+        self.columns = []
+        if n == 0 or self.total <= 0:
+            return
+
+        scaled = [w * n / self.total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # anything left over is only off from 1.0 by floating point error
+        for i in small + large:
+            self.prob[i] = 1.0
+
+        self.columns = [(self.prob[i], self.options[i], self.options[self.alias[i]]) for i in range(n)]
+
+    def sample(self, rng=random):
+        if not self.columns:
+            if not self.options:
+                return None
+            raise ValueError('Total of weights must be greater than zero')
+
+        # one draw picks the column, and what's left over after the integer part is uniform too, so it picks between
+        # the column and its alias
+        u = rng.random() * len(self.columns)
+        i = int(u)
+        prob, option, alias = self.columns[i]
+        return option if u - i < prob else alias
+
+
+class Constant():
+    """
+    An option that isn't weighted, rolls as itself.  Scalars are converted like pyz3r.mystery.get_random_option does.
+    """
+
+    def __init__(self, value):
+        # nested dictionaries (customizer settings and the like) aren't weights, so leave them alone
+        self.value = value if isinstance(value, dict) else conv(value)
+
+    def sample(self, rng=random):
+        return self.value
+
+
+def compile_option(optset):
+    if isinstance(optset, dict) and all(isinstance(w, (int, float)) for w in optset.values()):
+        if len(optset) == 1 and next(iter(optset.values())) > 0:
+            # nothing to roll
+            return Constant(next(iter(optset)))
+        return AliasSampler(optset)
+    return Constant(optset)
+
+
+def roll_option(compiled, rng=random):
+    return compiled.sample(rng)
+
+
+class CompiledWeightset():
+    """
+    A mystery weightset with every option, subweight and rule action compiled into an AliasSampler.
+
+    Subweights are merged into their parent weightset at compile time, so walking down the
+    subweight tree while rolling is just following references.
+    """
+
+    def __init__(self, weights: dict, parent=None):
+        if parent is None:
+            self.weights = weights
+            self.options = {}
+            rules = weights.get('rules', [])
+        else:
+            # equivalent to {**parent, **subweights} in mysterydoors.generate_doors_mystery
+            self.weights = {**parent.weights, **weights, 'subweights': weights.get('subweights', {})}
+            self.options = dict(parent.options)
+            rules = weights.get('rules', parent.weights.get('rules', []))
+
+        for key, value in weights.items():
+            if key in ['subweights', 'rules']:
+                continue
+            self.options[key] = compile_option(value)
+
+        # eq, custom and pool are rolled key by key, the rest of the customizer section is read as is
+        customizer = self.weights.get('customizer') or {}
+        self.customizer = {
+            section: {k: compile_option(v) for k, v in customizer[section].items()}
+            for section in ['eq', 'custom', 'pool'] if section in customizer
+        }
+
+        self.rules = [
+            (rule.get('conditions', {}), {k: compile_option(v) for k, v in rule.get('actions', {}).items()})
+            for rule in rules
+        ]
+
+        subweights = self.weights.get('subweights', {})
+        self.subweight_sampler = AliasSampler({k: v['chance'] for k, v in subweights.items()})
+        self.subweights = {
+            conv(k): CompiledWeightset(v.get('weights', {}), parent=self) for k, v in subweights.items()
+        }
+
+    def get(self, key, default=None):
+        return self.weights.get(key, default)
+
+    def __getitem__(self, key):
+        return self.weights[key]
+
+    def __contains__(self, key):
+        return key in self.weights
+
+    def roll(self, key, default=MISSING, rng=random):
+        if key in self.options:
+            return self.options[key].sample(rng)
+        if default is MISSING:
+            raise KeyError(key)
+        if isinstance(default, dict):
+            return compile_option(default).sample(rng)
+        return conv(default)
+
+    def roll_subweights(self, rng=random):
+        """
+        Walk the subweight tree and return the compiled weightset that ends up being used.
+        """
+        weightset = self
+        while True:
+            subweight_name = weightset.subweight_sampler.sample(rng)
+            if subweight_name is None:
+                return weightset
+            weightset = weightset.subweights[subweight_name]
@@ -1,6 +1,9 @@
 import json
+import os
 
 from ..util import orm
+from ..util.auditarchive import ARCHIVE
+from ..util.writebehind import WriteBehindQueue
 
 
 async def insert_message(guild_id: int, message_id: int, user_id: int, channel_id: int, message_date, content, attachment):
@@ -11,14 +14,132 @@ async def insert_message(guild_id: int, message_id: int, user_id: int, channel_i
     )
 
 
-async def get_cached_messages(message_id: int):
+# the columns of a queued row, in order
+QUEUED_COLUMNS = ('guild_id', 'message_id', 'user_id', 'channel_id', 'message_date', 'content', 'attachment', 'deleted')
+
+
+async def insert_messages(rows):
+    """
+    rows is a list of (guild_id, message_id, user_id, channel_id, message_date, content, attachment, deleted)
+    """
+    await orm.execute_many(
+        'INSERT INTO audit_messages (guild_id, message_id, user_id, channel_id, message_date, content, attachment, deleted) values (%s, %s, %s, %s, %s, %s, %s, %s)',
+        rows
+    )
+
+
+# default days a guild's messages stay in audit_messages before being archived, 0 keeps them forever, guilds can
+# override it with the AuditRetentionDays setting
+AUDIT_RETENTION_DAYS = int(os.environ.get('AUDIT_RETENTION_DAYS', '0'))
+AUDIT_ARCHIVE_BATCH_SIZE = int(os.environ.get('AUDIT_ARCHIVE_BATCH_SIZE', '5000'))
+
+# innodb_ft_min_token_size on the database server
+FULLTEXT_MIN_TOKEN_SIZE = int(os.environ.get('DB_FULLTEXT_MIN_TOKEN_SIZE', '3'))
+
+# messages are logged through this instead of one INSERT each, so a busy server doesn't tie up the connection pool
+MESSAGE_WRITER = WriteBehindQueue(
+    insert_messages,
+    max_rows=int(os.environ.get('AUDIT_FLUSH_ROWS', '200')),
+    max_delay=int(os.environ.get('AUDIT_FLUSH_MS', '1000')) / 1000,
+    max_pending=int(os.environ.get('AUDIT_MAX_PENDING', '20000')),
+    max_attempts=int(os.environ.get('AUDIT_MAX_ATTEMPTS', '3')),
+    name='audit messages'
+)
+
+
+async def insert_archived_deletions(rows):
+    """
+    rows is a list of (guild_id, message_id) of deleted messages.  Only the ones that have been archived are recorded,
+    looked up a guild at a time.
+    """
+    by_guild = {}
+    for guild_id, message_id in rows:
+        by_guild.setdefault(guild_id, []).append(message_id)
+
+    archived = []
+    for guild_id, message_ids in by_guild.items():
+        archived += [(guild_id, message_id) for message_id in await ARCHIVE.contains_any(guild_id, message_ids)]
+    if archived:
+        await orm.execute_many(
+            'INSERT IGNORE INTO audit_archived_deletions (guild_id, message_id) values (%s, %s)',
+            archived
+        )
+
+
+# deletions are checked against the archive in batches, rather than with a trip to an executor thread for every one
+DELETION_WRITER = WriteBehindQueue(
+    insert_archived_deletions,
+    max_rows=int(os.environ.get('AUDIT_FLUSH_ROWS', '200')),
+    max_delay=int(os.environ.get('AUDIT_FLUSH_MS', '1000')) / 1000,
+    max_pending=int(os.environ.get('AUDIT_MAX_PENDING', '20000')),
+    max_attempts=int(os.environ.get('AUDIT_MAX_ATTEMPTS', '3')),
+    name='audit archived deletions'
+)
+
+
+async def queue_message(guild_id: int, message_id: int, user_id: int, channel_id: int, message_date, content, attachment):
+    return await MESSAGE_WRITER.put((guild_id, message_id, user_id, channel_id, message_date, content, attachment, 0))
+
+
+def get_queued_messages(message_ids):
+    """
+    The newest version of each of message_ids that's still waiting to be written, by message id.  These are newer
+    than anything in the table.
+    """
+    message_ids = set(message_ids)
+    queued = {}
+    for row in MESSAGE_WRITER.find(lambda row: row[1] in message_ids):
+        queued[row[1]] = dict(zip(QUEUED_COLUMNS, row), id=None)
+    return queued
+
+
+async def get_cached_messages(message_id: int, guild_id: int = None):
     result = await orm.select(
         'SELECT * from audit_messages WHERE message_id=%s order by id asc;',
         [message_id]
     )
+    if not result and guild_id is not None:
+        result = await ARCHIVE.get_messages(guild_id, message_id)
     return result
 
 
+async def get_latest_message(message_id: int, guild_id: int = None):
+    queued = get_queued_messages([message_id])
+    if queued:
+        return queued[message_id]
+
+    results = await orm.select(
+        'SELECT * from audit_messages WHERE message_id=%s order by id desc LIMIT 1;',
+        [message_id]
+    )
+    if not results and guild_id is not None:
+        results = await ARCHIVE.get_messages(guild_id, message_id)
+    return results[-1] if results else None
+
+
+async def get_latest_messages(message_ids, guild_id: int = None):
+    if not message_ids:
+        return []
+    queued = get_queued_messages(message_ids)
+    message_ids = [message_id for message_id in message_ids if message_id not in queued]
+
+    results = []
+    if message_ids:
+        placeholders = ', '.join(['%s'] * len(message_ids))
+        results = list(await orm.select(
+            f'SELECT m.* from audit_messages m JOIN (SELECT MAX(id) AS id from audit_messages WHERE message_id IN ({placeholders}) GROUP BY message_id) latest ON m.id = latest.id;',
+            list(message_ids)
+        ))
+    if guild_id is not None:
+        found = set(result['message_id'] for result in results)
+        for message_id in message_ids:
+            if message_id not in found:
+                archived = await ARCHIVE.get_messages(guild_id, message_id)
+                if archived:
+                    results.append(archived[-1])
+    return sorted(results + list(queued.values()), key=lambda message: message['message_date'])
+
+
 async def get_deleted_messages_for_user(guild_id: int, user_id: int, limit=500):
     result = await orm.select(
         'SELECT message_date, content, attachment, deleted from audit_messages WHERE guild_id=%s and user_id=%s and deleted=1 order by message_date desc LIMIT %s;',
@@ -35,11 +156,169 @@ async def get_messages_for_user(guild_id: int, user_id: int, limit=500):
     return result
 
 
-async def set_deleted(message_id: int):
+async def iter_deleted_messages_for_user(guild_id: int, user_id: int, limit=500):
+    hot = orm.select_iter(
+        'SELECT id, message_date, content, attachment, deleted from audit_messages WHERE guild_id=%s and user_id=%s and deleted=1 order by message_date desc LIMIT %s;',
+        [guild_id, user_id, limit]
+    )
+    archived_deletions = await get_archived_deletions(guild_id)
+    async for message in with_archived(hot, ARCHIVE.iter_messages(guild_id, user_id=user_id), limit, archived_deletions, deleted=1):
+        yield message
+
+
+async def iter_messages_for_user(guild_id: int, user_id: int, limit=500):
+    hot = orm.select_iter(
+        'SELECT id, message_date, content, attachment, deleted from audit_messages WHERE guild_id=%s and user_id=%s order by message_date desc LIMIT %s;',
+        [guild_id, user_id, limit]
+    )
+    archived_deletions = await get_archived_deletions(guild_id)
+    async for message in with_archived(hot, ARCHIVE.iter_messages(guild_id, user_id=user_id), limit, archived_deletions):
+        yield message
+
+
+async def with_archived(hot, archived, limit, archived_deletions, deleted=None):
+    """
+    Yield the rows from hot, then archived rows until there's limit in total.  Archived rows are older than anything
+    left in the table, apart from edits to old messages.  Messages in archived_deletions were deleted after they were
+    archived, and are marked deleted before filtering on deleted.
+    """
+    count = 0
+    async for message in hot:
+        yield message
+        count += 1
+    if count >= limit:
+        return
+    async for message in archived:
+        if message['message_id'] in archived_deletions:
+            message['deleted'] = 1
+        if deleted is not None and message['deleted'] != deleted:
+            continue
+        yield message
+        count += 1
+        if count >= limit:
+            return
+
+
+async def get_archived_deletions(guild_id: int):
+    results = await orm.select(
+        'SELECT message_id from audit_archived_deletions WHERE guild_id=%s;',
+        [guild_id]
+    )
+    deletions = set(result['message_id'] for result in results)
+    # not checked against the archive yet, but marking a message that isn't archived changes nothing
+    deletions.update(row[1] for row in DELETION_WRITER.find(lambda row: row[0] == guild_id))
+    return deletions
+
+
+async def record_archived_deletions(guild_id: int, message_ids):
+    """
+    Archive files aren't rewritten, so deletions of archived messages are kept in audit_archived_deletions instead.
+    """
+    for message_id in message_ids:
+        await DELETION_WRITER.put((guild_id, message_id))
+
+
+async def archive_messages(guild_id: int, cutoff, batch_size=AUDIT_ARCHIVE_BATCH_SIZE):
+    """
+    Move guild_id's messages from before cutoff into the archive, batch_size at a time.  Each batch is on disk before
+    it's deleted from the table.  Returns the number of rows moved.
+    """
+    moved = 0
+    while True:
+        rows = await orm.select(
+            'SELECT * from audit_messages WHERE guild_id=%s and message_date < %s order by id asc LIMIT %s;',
+            [guild_id, cutoff, batch_size]
+        )
+        if not rows:
+            return moved
+        await ARCHIVE.write_async(guild_id, rows)
+        # anything inserted since has a higher id, even an edit of an old message
+        await orm.execute(
+            'DELETE FROM audit_messages WHERE guild_id=%s and message_date < %s and id <= %s',
+            [guild_id, cutoff, rows[-1]['id']]
+        )
+        moved += len(rows)
+        if len(rows) < batch_size:
+            return moved
+
+
+def boolean_query(query):
+    """
+    Plain words all have to match, like most search boxes.  Words too short to be indexed are left optional, since
+    requiring one would match nothing.  A query already using boolean mode operators is left alone.
+    """
+    if any(c in query for c in '+-"<>()~*@'):
+        return query
+    return ' '.join(f'+{word}' if len(word) >= FULLTEXT_MIN_TOKEN_SIZE else word for word in query.split())
+
+
+async def search_messages(guild_id: int, query, channel_id: int = None, user_id: int = None, after=None, before=None, deleted: int = None, limit=10, offset=0):
+    """
+    Search the content of guild_id's messages using the fulltext index, newest first.  Only messages still in the
+    table are searched, not the archive.
+    """
+    sql = 'SELECT id, message_id, user_id, channel_id, message_date, content, attachment, deleted from audit_messages WHERE MATCH(content) AGAINST (%s IN BOOLEAN MODE) and guild_id=%s'
+    args = [boolean_query(query), guild_id]
+    if channel_id is not None:
+        sql += ' and channel_id=%s'
+        args.append(channel_id)
+    if user_id is not None:
+        sql += ' and user_id=%s'
+        args.append(user_id)
+    if after is not None:
+        sql += ' and message_date >= %s'
+        args.append(after)
+    if before is not None:
+        sql += ' and message_date < %s'
+        args.append(before)
+    if deleted is not None:
+        sql += ' and deleted=%s'
+        args.append(deleted)
+    sql += ' order by message_date desc, id desc LIMIT %s OFFSET %s;'
+    args += [limit, offset]
+    return await orm.select(sql, args)
+
+
+async def set_deleted(message_id: int, guild_id: int = None):
+    await set_queued_deleted([message_id])
     await orm.execute(
         'UPDATE audit_messages SET deleted=1 WHERE message_id=%s',
         [message_id]
     )
+    if guild_id is not None:
+        await record_archived_deletions(guild_id, [message_id])
+
+
+async def set_queued_deleted(message_ids):
+    """
+    Mark messages that haven't been written yet as deleted in the queue, so they don't need to be written first.
+    """
+    message_ids = set(message_ids)
+
+    def match(row):
+        return row[1] in message_ids
+
+    def mark_deleted(row):
+        return row[:7] + (1,)
+
+    if MESSAGE_WRITER.replace(match, mark_deleted):
+        # some are being written right now, the UPDATE has to come after that
+        await MESSAGE_WRITER.wait_written()
+        # a failed write puts them back in the queue
+        MESSAGE_WRITER.replace(match, mark_deleted)
+
+
+async def set_deleted_many(message_ids, guild_id: int = None):
+    if not message_ids:
+        return
+    await set_queued_deleted(message_ids)
+    placeholders = ', '.join(['%s'] * len(message_ids))
+    await orm.execute(
+        f'UPDATE audit_messages SET deleted=1 WHERE message_id IN ({placeholders})',
+        list(message_ids)
+    )
+    if guild_id is not None:
+        await record_archived_deletions(guild_id, message_ids)
 
 
 async def insert_generated_game(randomizer, hash_id, permalink, settings, gentype, genoption, customizer=0):
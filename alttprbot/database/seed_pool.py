@@ -0,0 +1,35 @@
+import uuid
+
+from ..util import orm
+
+
+async def insert_seed(randomizer, preset, variant, hash_id, permalink):
+    await orm.execute(
+        'INSERT INTO seed_pool (randomizer, preset, variant, hash_id, permalink) values (%s, %s, %s, %s, %s)',
+        [randomizer, preset, variant, hash_id, permalink]
+    )
+
+
+async def claim_seed(preset, variant):
+    # claim with a single UPDATE so two rooms rolling at the same time can never get the same seed
+    token = uuid.uuid4().hex
+    claimed = await orm.execute(
+        'UPDATE seed_pool SET claimed=%s, claimed_at=CURRENT_TIMESTAMP WHERE preset=%s AND variant=%s AND claimed IS NULL ORDER BY id LIMIT 1',
+        [token, preset, variant]
+    )
+    if not claimed:
+        return None
+
+    results = await orm.select(
+        'SELECT * from seed_pool WHERE claimed=%s;',
+        [token]
+    )
+    return results[0] if results else None
+
+
+async def count_available(preset, variant):
+    results = await orm.select(
+        'SELECT count(*) as available from seed_pool WHERE preset=%s AND variant=%s AND claimed IS NULL;',
+        [preset, variant]
+    )
+    return results[0]['available']
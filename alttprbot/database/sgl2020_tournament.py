@@ -16,6 +16,16 @@ async def update_tournament_race_status(room_name: int, status="STARTED"):
     )
 
 
+async def update_tournament_race_statuses(room_names, status="STARTED"):
+    if not room_names:
+        return
+    placeholders = ', '.join(['%s'] * len(room_names))
+    await orm.execute(
+        f'UPDATE sgl2020_tournament SET status = %s WHERE room_name IN ({placeholders})',
+        [status] + list(room_names)
+    )
+
+
 async def get_active_tournament_race(room_name: str):
     results = await orm.select(
         'SELECT * from sgl2020_tournament where room_name=%s and status IS NULL;',
@@ -22,6 +22,36 @@ async def insert_rtgg_id(discord_user_id, rtgg_id):
     )
 
 
+async def insert_srl_nicks(nicks, srl_verified: int = 0):
+    """
+    nicks is a list of (discord_user_id, srl_nick)
+    """
+    await orm.execute_many(
+        'INSERT INTO srlnick(`discord_user_id`, `srl_nick`, `srl_verified`) VALUES (%s,%s,%s) ON DUPLICATE KEY UPDATE `srl_nick` = VALUES(`srl_nick`), `srl_verified` = VALUES(`srl_verified`);',
+        [(discord_user_id, srl_nick, srl_verified) for discord_user_id, srl_nick in nicks]
+    )
+
+
+async def insert_twitch_names(twitch_names):
+    """
+    twitch_names is a list of (discord_user_id, twitch_name)
+    """
+    await orm.execute_many(
+        'INSERT INTO srlnick(discord_user_id, twitch_name) VALUES (%s,%s) ON DUPLICATE KEY UPDATE twitch_name = VALUES(twitch_name);',
+        twitch_names
+    )
+
+
+async def insert_rtgg_ids(rtgg_ids):
+    """
+    rtgg_ids is a list of (discord_user_id, rtgg_id)
+    """
+    await orm.execute_many(
+        'INSERT INTO srlnick(discord_user_id, rtgg_id) VALUES (%s,%s) ON DUPLICATE KEY UPDATE rtgg_id = VALUES(rtgg_id);',
+        rtgg_ids
+    )
+
+
 async def get_discord_id(srl_nick):
     results = await orm.select(
         'SELECT * from srlnick where srl_nick=%s;',
@@ -96,4 +96,16 @@ async def mark_as_written(srl_id):
         'UPDATE tournament_results SET written_to_gsheet=1 where srl_id=%s;',
         [srl_id]
     )
-    await CACHE.delete(key)
\ No newline at end of file
+    await CACHE.delete(key)
+
+
+async def mark_as_recorded(srl_ids):
+    if not srl_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(srl_ids))
+    await orm.execute(
+        f'UPDATE tournament_results SET status="RECORDED", written_to_gsheet=1 where srl_id IN ({placeholders});',
+        list(srl_ids)
+    )
+    for srl_id in srl_ids:
+        await CACHE.delete(f'tournament_race_{srl_id}')
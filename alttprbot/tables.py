@@ -28,9 +28,20 @@ t_audit_messages = Table(
     Column('user_id', BIGINT(20)),
     Column('channel_id', BIGINT(20)),
     Column('message_date', DateTime),
-    Column('content', String(4000, 'utf8mb4_bin')),
+    Column('content', String(4000, 'utf8mb4_unicode_ci')),
     Column('attachment', String(2000, 'utf8mb4_bin')),
-    Column('deleted', INTEGER(11), server_default=text("'0'"))
+    Column('deleted', INTEGER(11), server_default=text("'0'")),
+    Index('idx_audit_messages_guild_user_date', 'guild_id', 'user_id', 'message_date'),
+    Index('idx_audit_messages_guild_date', 'guild_id', 'message_date'),
+    Index('idx_audit_messages_content_fulltext', 'content', mysql_prefix='FULLTEXT')
+)
+
+
+t_audit_archived_deletions = Table(
+    'audit_archived_deletions', metadata,
+    Column('guild_id', BIGINT(20), nullable=False, index=True),
+    Column('message_id', BIGINT(20), primary_key=True),
+    Column('deleted_at', DateTime, server_default=text("CURRENT_TIMESTAMP"))
 )
 
 
@@ -146,6 +157,21 @@ t_seed_presets = Table(
 )
 
 
+t_seed_pool = Table(
+    'seed_pool', metadata,
+    Column('id', INTEGER(11), primary_key=True),
+    Column('randomizer', String(45), nullable=False),
+    Column('preset', String(45), nullable=False),
+    Column('variant', String(45), nullable=False),
+    Column('hash_id', String(50), nullable=False),
+    Column('permalink', String(2000)),
+    Column('claimed', String(45)),
+    Column('created', DateTime, server_default=text("CURRENT_TIMESTAMP")),
+    Column('claimed_at', DateTime),
+    Index('idx_seed_pool_preset_variant_claimed', 'preset', 'variant', 'claimed')
+)
+
+
 t_smz3_multiworld = Table(
     'smz3_multiworld', metadata,
     Column('message_id', BIGINT(20), primary_key=True),
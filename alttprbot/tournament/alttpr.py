@@ -6,15 +6,13 @@ import random
 import os
 import isodate
 
-import aiohttp
 import discord
 import pyz3r.customizer
-import gspread_asyncio
 import pytz
 
 from alttprbot.alttprgen import preset
 from alttprbot.database import (tournament_results, srlnick, tournaments, tournament_games)
-from alttprbot.util import gsheet, speedgaming
+from alttprbot.util import gsheet, http, rtgg, speedgaming
 from alttprbot.exceptions import SahasrahBotException
 from alttprbot_discord.bot import discordbot
 from alttprbot_discord.util import alttpr_discord
@@ -318,11 +316,7 @@ async def create_tournament_race_room(episodeid, category='alttpr', goal='Beat t
     rtgg_alttpr = racetime.racetime_bots[category]
     race = await tournament_results.get_active_tournament_race_by_episodeid(episodeid)
     if race:
-        async with aiohttp.request(
-                method='get',
-                url=rtgg_alttpr.http_uri(f"/{race['srl_id']}/data"),
-                raise_for_status=True) as resp:
-            race_data = json.loads(await resp.read())
+        race_data = await http.request_generic(rtgg_alttpr.http_uri(f"/{race['srl_id']}/data"), returntype='json')
         status = race_data.get('status', {}).get('value')
         if not status == 'cancelled':
             return
@@ -561,29 +555,23 @@ async def race_recording_task():
     if races is None:
         return
 
-    agcm = gspread_asyncio.AsyncioGspreadClientManager(gsheet.get_creds)
-    agc = await agcm.authorize()
-    wb = await agc.open_by_key(TOURNAMENT_RESULTS_SHEET)
+    batch = gsheet.ResultsBatch(TOURNAMENT_RESULTS_SHEET)
+    races = {race['srl_id']: race for race in races}
+    race_data_by_room = await rtgg.get_due_race_data(races.keys())
 
-    for race in races:
+    for srl_id, race_data in race_data_by_room.items():
+        race = races[srl_id]
         logging.info(f"Recording {race['episode_id']}")
         try:
-
-            sheet_name = race['event']
-            wks = await wb.worksheet(sheet_name)
-
-            async with aiohttp.request(
-                    method='get',
-                    url=f"https://racetime.gg/{race['srl_id']}/data",
-                    raise_for_status=True) as resp:
-                race_data = json.loads(await resp.read())
+            if isinstance(race_data, Exception):
+                raise race_data
 
             if race_data['status']['value'] == 'finished':
                 winner = [e for e in race_data['entrants'] if e['place'] == 1][0]
                 runnerup = [e for e in race_data['entrants'] if e['place'] in [2, None]][0]
 
                 started_at = isodate.parse_datetime(race_data['started_at']).astimezone(pytz.timezone('US/Eastern'))
-                await wks.append_row(values=[
+                batch.add(race['event'], [
                     race['episode_id'],
                     started_at.strftime("%Y-%m-%d %H:%M:%S"),
                     f"https://racetime.gg/{race['srl_id']}",
@@ -593,9 +581,7 @@ async def race_recording_task():
                     str(isodate.parse_duration(runnerup['finish_time'])) if isinstance(runnerup['finish_time'], str) else None,
                     race['permalink'],
                     race['spoiler']
-                ])
-                await tournament_results.update_tournament_race_status(race['srl_id'], "RECORDED")
-                await tournament_results.mark_as_written(race['srl_id'])
+                ], key=race['srl_id'])
             elif race_data['status']['value'] == 'cancelled':
                 await tournament_results.delete_active_tournament_race_all(race['srl_id'])
             else:
@@ -603,4 +589,8 @@ async def race_recording_task():
         except Exception as e:
             logging.exception("Encountered a problem when attempting to record a race.")
 
+    # only races whose rows made it onto the sheet get marked, the rest are tried again next time
+    written = await batch.flush()
+    await tournament_results.mark_as_recorded(written)
+
     logging.debug('done')
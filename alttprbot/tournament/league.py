@@ -3,7 +3,6 @@ import os
 import logging
 import json
 
-import aiohttp
 import discord
 from pytz import timezone
 from pyz3r.mystery import get_random_option
@@ -11,7 +10,7 @@ from pyz3r.mystery import get_random_option
 from alttprbot.alttprgen import mystery, preset, spoilers
 from alttprbot.database import (config, spoiler_races, tournament_results,
                                 twitch_command_text, srlnick, league_playoffs)
-from alttprbot.util import speedgaming
+from alttprbot.util import http, speedgaming
 from alttprbot.exceptions import SahasrahBotException
 from alttprbot_discord.bot import discordbot
 from alttprbot_discord.util import alttpr_discord
@@ -142,16 +141,14 @@ class LeaguePlayer():
         if name_type == "discord_id":
             name = int(name)
 
-        async with aiohttp.request(
-            method='get',
-            url='https://alttprleague.com/json_ep/player/',
-            params={
+        r = await http.request_generic(
+            'https://alttprleague.com/json_ep/player/',
+            reqparams={
                 name_type_map[name_type]: name,
             },
-            raise_for_status=True
-        ) as resp:
-            r = await resp.json()
-            players = r['results']
+            returntype='json'
+        )
+        players = r['results']
 
         if players is None:
             return None
@@ -539,11 +536,7 @@ async def create_league_race_room(episodeid):
     rtgg_alttpr = racetime.racetime_bots['alttpr']
     race = await tournament_results.get_active_tournament_race_by_episodeid(episodeid)
     if race:
-        async with aiohttp.request(
-                method='get',
-                url=rtgg_alttpr.http_uri(f"/{race['srl_id']}/data"),
-                raise_for_status=True) as resp:
-            race_data = json.loads(await resp.read())
+        race_data = await http.request_generic(rtgg_alttpr.http_uri(f"/{race['srl_id']}/data"), returntype='json')
         status = race_data.get('status', {}).get('value')
         if not status == 'cancelled':
             return
@@ -619,16 +612,17 @@ async def create_league_race_room(episodeid):
             continue
 
     if os.environ.get("LEAGUE_SUBMIT_GAME_SECRET"):
-        async with aiohttp.request(
-            method='get',
-            url='https://alttprleague.com/json_ep/submit-game/',
+        await http.request(
+            'get',
+            'https://alttprleague.com/json_ep/submit-game/',
+            returntype=None,
+            raise_for_status=False,
             params={
                 'slug': handler.data.get('name'),
                 'sg': episodeid,
                 'secret': os.environ.get("LEAGUE_SUBMIT_GAME_SECRET")
             }
-        ) as _:
-            pass
+        )
     else:
         logging.info(
             f"Would have reported match {handler.data.get('name')} for episode {episodeid}")
@@ -1,10 +1,10 @@
 import discord
-import gspread_asyncio
 from discord.ext import commands
 from oauth2client.service_account import ServiceAccountCredentials
 
 from alttprbot.database import srlnick
 from alttprbot.exceptions import SahasrahBotException
+from alttprbot.util import gsheet
 from alttprbot_discord.util.alttpr_discord import alttpr
 from config import Config as c
 
@@ -17,16 +17,14 @@ class InvalidSettingsException(SahasrahBotException):
     pass
 
 
-async def get_settings(episodeid, guildid):
-    agcm = gspread_asyncio.AsyncioGspreadClientManager(get_creds)
-    agc = await agcm.authorize()
-    wb = await agc.open_by_key(c.Tournament[guildid]['schedule_sheet'])
-    wks = await wb.worksheet('Schedule')
-
-    for row in await wks.get_all_records():
-        if row['Game ID'] == episodeid:
-            return row
-    return None
+async def get_settings(episodeid, guildid, refresh=False):
+    snapshot = await gsheet.SNAPSHOTS.get(c.Tournament[guildid]['schedule_sheet'], 'Schedule', refresh=refresh)
+    sheet_settings = snapshot.lookup('Game ID', episodeid)
+    if sheet_settings is None and not refresh:
+        # the settings may have been submitted since the snapshot was taken
+        snapshot = await gsheet.SNAPSHOTS.get(c.Tournament[guildid]['schedule_sheet'], 'Schedule', refresh=True)
+        sheet_settings = snapshot.lookup('Game ID', episodeid)
+    return sheet_settings
 
 
 async def generate_game(episodeid, guildid):
@@ -140,25 +138,36 @@ def sanity_check(game, dis, goal, crystals, state, swords):
 
 
 async def loadnicks(ctx):
-    agcm = gspread_asyncio.AsyncioGspreadClientManager(get_creds)
-    agc = await agcm.authorize()
-    wb = await agc.open_by_key(c.Tournament[ctx.guild.id]['registration_sheet'])
-    wks = await wb.get_worksheet(0)
+    registration_sheet = c.Tournament[ctx.guild.id]['registration_sheet']
+    # row numbers are written back, so they have to come from the sheet as it is now
+    snapshot = await gsheet.SNAPSHOTS.get(registration_sheet, refresh=True)
+    wks = await gsheet.WORKSHEETS.get(registration_sheet, 0)
 
     bad_discord_names = []
+    loaded = []
 
-    for idx, row in enumerate(await wks.get_all_records()):
+    for idx, row in enumerate(snapshot.records):
         if not row['Nick Loaded'] in ['Y', 'ignore']:
             try:
                 member = await commands.MemberConverter().convert(ctx, row['Discord Name'])
                 player_role = await commands.RoleConverter().convert(ctx, c.Tournament[ctx.guild.id]['player_role'])
-                await srlnick.insert_srl_nick(member.id, row['SRL Name'])
-                await srlnick.insert_twitch_name(member.id, row['Twitch Name'])
-                await member.add_roles(player_role)
-                await wks.update_cell(idx+2, 5, 'Y')
             except discord.ext.commands.errors.BadArgument:
                 bad_discord_names.append(row['Discord Name'])
                 await wks.update_cell(idx+2, 5, 'Error')
+                continue
+            loaded.append((idx, row, member, player_role))
+
+    if loaded:
+        # write every registration to the database in one go, then hand out roles and mark the rows
+        await srlnick.insert_srl_nicks([(member.id, row['SRL Name']) for _, row, member, _ in loaded])
+        await srlnick.insert_twitch_names([(member.id, row['Twitch Name']) for _, row, member, _ in loaded])
+
+        for idx, row, member, player_role in loaded:
+            await member.add_roles(player_role)
+            await wks.update_cell(idx+2, 5, 'Y')
+
+    # we just changed the sheet
+    gsheet.SNAPSHOTS.invalidate(registration_sheet)
 
     if len(bad_discord_names) > 0:
         await ctx.send("Bad discord names.  These names were not processed.\n\n`{names}`".format(
@@ -1,5 +1,4 @@
 import datetime
-import json
 import logging
 import random
 import string
@@ -7,17 +6,15 @@ import asyncio
 import os
 import logging
 
-import aiohttp
 import discord
 import dateutil.parser
-import gspread_asyncio
 from slugify import slugify
 import isodate
 import pytz
 
 from alttprbot.alttprgen import preset, randomizer
 from alttprbot.database import config, sgl2020_tournament, sgl2020_tournament_bo3, patch_distribution
-from alttprbot.util import gsheet, speedgaming
+from alttprbot.util import gsheet, http, rtgg, speedgaming
 from alttprbot_discord.bot import discordbot
 import alttprbot_racetime.bot
 from config import Config as c
@@ -243,8 +240,7 @@ class SGLiveRace():
         )
         await loop.run_in_executor(None, set_anyone.execute)
 
-        agcm = gspread_asyncio.AsyncioGspreadClientManager(gsheet.get_creds)
-        agc = await agcm.authorize()
+        agc = await gsheet.AGCM.authorize()
         wb = await agc.open_by_key(self.seed_id)
         wks = await wb.get_worksheet(0)
 
@@ -739,11 +735,7 @@ async def create_sgl_race_room(episode_id, force=False):
     if race and not force:
         if bo3:
             return
-        async with aiohttp.request(
-                method='get',
-                url=rtgg_sgl.http_uri(f"/{race['room_name']}/data"),
-                raise_for_status=True) as resp:
-            race_data = json.loads(await resp.read())
+        race_data = await http.request_generic(rtgg_sgl.http_uri(f"/{race['room_name']}/data"), returntype='json')
         status = race_data.get('status', {}).get('value')
         if not status == 'cancelled':
             return
@@ -873,31 +865,36 @@ async def scan_sgl_schedule():
     else:
         events = EVENTS.keys()
     logging.info("SGL - scanning SG schedule for races to create")
-    for event in events:
-        await asyncio.sleep(1) # this keeps SG's API from getting rekt
+    schedules = await speedgaming.scan_schedules({
+        event: (0.5, .53 + (0 if c.DEBUG else EVENTS[event]['delay']/60)) for event in events
+    })
+
+    episodes = {}
+    for event, result in schedules.items():
+        if isinstance(result, Exception):
+            logging.error("Encountered a problem when attempting to retrieve SG schedule.", exc_info=result)
+            if audit_channel:
+                await audit_channel.send(
+                    f"There was an error while trying to scan schedule for {event}`.\n\n{str(result)}")
+            continue
+        for episode in result:
+            episodes[episode['id']] = episode
+
+    async def create_match(episode):
+        logging.info(episode['id'])
         try:
-            delay = 0 if c.DEBUG else EVENTS[event]['delay']/60
-            episodes = await speedgaming.get_upcoming_episodes_by_event(event, hours_past=0.5, hours_future=.53+delay)
+            await create_sgl_match(episode)
         except Exception as e:
             logging.exception(
-                "Encountered a problem when attempting to retrieve SG schedule.")
+                "Encountered a problem when attempting to create RT.gg race room.")
             if audit_channel:
                 await audit_channel.send(
-                    f"There was an error while trying to scan schedule for {event}`.\n\n{str(e)}")
-            continue
-        for episode in episodes:
-            logging.info(episode['id'])
-            try:
-                await create_sgl_match(episode)
-            except Exception as e:
-                logging.exception(
-                    "Encountered a problem when attempting to create RT.gg race room.")
-                if audit_channel:
-                    await audit_channel.send(
-                        f"<@185198185990324225> There was an error while automatically creating a race room for episode `{episode['id']}`.\n\n{str(e)}",
-                        allowed_mentions=discord.AllowedMentions(
-                            everyone=True)
-                    )
+                    f"<@185198185990324225> There was an error while automatically creating a race room for episode `{episode['id']}`.\n\n{str(e)}",
+                    allowed_mentions=discord.AllowedMentions(
+                        everyone=True)
+                )
+
+    await speedgaming.run_bounded(list(episodes.values()), create_match)
 
     logging.info('done')
 
@@ -911,10 +908,18 @@ async def race_recording_task(bo3=False):
         races = await sgl2020_tournament_bo3.get_unrecorded_races()
     else:
         races = await sgl2020_tournament.get_unrecorded_races()
+
+    batch = gsheet.ResultsBatch(SGL_RESULTS_SHEET)
+    race_data_by_room = await rtgg.get_due_race_data([race['room_name'] for race in races])
     for race in races:
+        if race['room_name'] not in race_data_by_room:
+            continue
         logging.info(race['episode_id'])
         try:
-            await record_episode(race, bo3=bo3)
+            race_data = race_data_by_room[race['room_name']]
+            if isinstance(race_data, Exception):
+                raise race_data
+            await queue_episode(race, batch, bo3=bo3, race_data=race_data)
         except Exception as e:
             logging.exception(
                 "Encountered a problem when attempting to record a race.")
@@ -922,6 +927,8 @@ async def race_recording_task(bo3=False):
                 await audit_channel.send(
                     f"There was an error while automatically creating a race room for episode `{race['episode_id']}`.\n\n{str(e)}")
 
+    await flush_episodes(batch, bo3=bo3)
+
     logging.info('done')
 
 
@@ -943,26 +950,28 @@ async def record_episode(race, bo3=False):
     if race['status'] == "RECORDED":
         return
 
-    sheet_name = EVENTS[race['event']].get('sheet')
+    batch = gsheet.ResultsBatch(SGL_RESULTS_SHEET)
+    await queue_episode(race, batch, bo3=bo3)
+    await flush_episodes(batch, bo3=bo3)
 
-    agcm = gspread_asyncio.AsyncioGspreadClientManager(gsheet.get_creds)
-    agc = await agcm.authorize()
-    wb = await agc.open_by_key(SGL_RESULTS_SHEET)
-    wks = await wb.worksheet(sheet_name)
+
+async def queue_episode(race, batch, bo3=False, race_data=None):
+    """
+    Add the race's results row to batch, if it has finished.  Cancelled races are deleted instead.  race_data is
+    fetched from racetime.gg unless it's given.
+    """
+    sheet_name = EVENTS[race['event']].get('sheet')
 
     if race['platform'] == 'racetime':
-        async with aiohttp.request(
-                method='get',
-                url=f"https://racetime.gg/{race['room_name']}/data",
-                raise_for_status=True) as resp:
-            race_data = json.loads(await resp.read())
+        if race_data is None:
+            race_data = await rtgg.get_race_data(race['room_name'])
 
         if race_data['status']['value'] == 'finished':
             winner = [e for e in race_data['entrants'] if e['place'] == 1][0]
             runnerup = [e for e in race_data['entrants']
                         if e['place'] in [2, None]][0]
 
-            await wks.append_row(values=[
+            batch.add(sheet_name, [
                 race['episode_id'],
                 f"https://racetime.gg/{race['room_name']}",
                 winner['user']['name'],
@@ -975,17 +984,15 @@ async def record_episode(race, bo3=False):
                 race['password'],
                 str(race['created']),
                 str(race['updated'])
-            ])
+            ], key=race['room_name'])
         elif race_data['status']['value'] == 'cancelled':
             if bo3:
                 await sgl2020_tournament_bo3.delete_active_tournament_race(race['room_name'])
             else:
                 await sgl2020_tournament.delete_active_tournament_race(race['room_name'])
-        else:
-            return
     else:
         episode_data = await speedgaming.get_episode(race['episode_id'])
-        await wks.append_row(values=[
+        batch.add(sheet_name, [
             race['episode_id'],
             None,
             episode_data['match1']['players'][0]['displayName'],
@@ -996,12 +1003,16 @@ async def record_episode(race, bo3=False):
             race['password'],
             str(race['created']),
             str(race['updated'])
-        ])
+        ], key=race['room_name'])
+
 
+async def flush_episodes(batch, bo3=False):
+    # only races whose rows made it onto the sheet get marked, the rest are tried again next time
+    written = await batch.flush()
     if bo3:
-        await sgl2020_tournament_bo3.update_tournament_race_status(race['room_name'], "RECORDED")
+        await sgl2020_tournament_bo3.update_tournament_race_statuses(written, "RECORDED")
     else:
-        await sgl2020_tournament.update_tournament_race_status(race['room_name'], "RECORDED")
+        await sgl2020_tournament.update_tournament_race_statuses(written, "RECORDED")
 
 
 def get_random_string(length):
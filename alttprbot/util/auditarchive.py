@@ -0,0 +1,297 @@
+"""
+Cold storage for audit_messages rows that have aged out of a guild's retention window.
+
+Rows are kept as gzipped JSON lines, one file per guild per month of message_date, at
+AUDIT_ARCHIVE_PATH/<guild_id>/<YYYY-MM>.jsonl.gz.  Each archive run appends a new gzip member to the file, which
+gzip reads back as one stream.  Next to each file is <YYYY-MM>.idx, a line of "<message_id> <offset> <user_id>" for
+every row, where offset is the start of the gzip member holding it, so a single message (or one user's messages) can
+be found by decompressing just those members instead of the whole month.
+"""
+import asyncio
+import collections
+import datetime
+import gzip
+import json
+import os
+import threading
+import zlib
+
+DISCORD_EPOCH = 1420070400000
+
+# month indexes kept in memory
+AUDIT_ARCHIVE_INDEX_CACHE_SIZE = int(os.environ.get('AUDIT_ARCHIVE_INDEX_CACHE_SIZE', '16'))
+
+
+def snowflake_time(snowflake):
+    # same as discord.utils.snowflake_time, without needing discord here
+    return datetime.datetime.utcfromtimestamp(((int(snowflake) >> 22) + DISCORD_EPOCH) / 1000)
+
+
+def encode_row(row):
+    row = dict(row)
+    if isinstance(row.get('message_date'), datetime.datetime):
+        row['message_date'] = row['message_date'].isoformat()
+    return json.dumps(row, ensure_ascii=False)
+
+
+def decode_row(line):
+    row = json.loads(line)
+    if row.get('message_date'):
+        row['message_date'] = datetime.datetime.fromisoformat(row['message_date'])
+    return row
+
+
+def decode_rows(data):
+    return [decode_row(line) for line in data.decode('utf-8').splitlines() if line.strip()]
+
+
+class MonthIndex():
+    """
+    The offsets of the members holding each message_id and each user_id's rows, for one month.
+    """
+
+    def __init__(self):
+        self.messages = collections.defaultdict(set)
+        self.users = collections.defaultdict(set)
+
+    def add(self, message_id, user_id, offset):
+        self.messages[message_id].add(offset)
+        self.users[user_id].add(offset)
+
+
+def read_member(f, offset):
+    """
+    Decompress the gzip member starting at offset, returns its data and the offset of the next member.
+    """
+    f.seek(offset)
+    decompressor = zlib.decompressobj(wbits=31)
+    chunks = []
+    while not decompressor.eof:
+        data = f.read(65536)
+        if not data:
+            raise EOFError(f"truncated gzip member at {offset}")
+        chunks.append(decompressor.decompress(data))
+    return b''.join(chunks), f.tell() - len(decompressor.unused_data)
+
+
+def read_members(f, size, offsets=None):
+    """
+    Decompress the members at offsets, or every member before size.
+    """
+    if offsets is not None:
+        for offset in offsets:
+            data, _ = read_member(f, offset)
+            yield data
+        return
+
+    offset = 0
+    while offset < size:
+        data, offset = read_member(f, offset)
+        yield data
+
+
+class AuditArchive():
+    def __init__(self, path, index_cache_size=AUDIT_ARCHIVE_INDEX_CACHE_SIZE):
+        self.path = path
+        self.index_cache_size = index_cache_size
+        self.indexes = collections.OrderedDict()
+        # (guild_id, month) -> where the last complete write to the month's file ends, readers stop there so they never
+        # see a member that's still being appended
+        self.committed = {}
+        # reads and writes run in executor threads
+        self._lock = threading.Lock()
+
+    def month_path(self, guild_id, month):
+        return os.path.join(self.path, str(guild_id), f"{month}.jsonl.gz")
+
+    def index_path(self, guild_id, month):
+        return os.path.join(self.path, str(guild_id), f"{month}.idx")
+
+    def months(self, guild_id):
+        """
+        The months archived for guild_id, newest first.
+        """
+        try:
+            filenames = os.listdir(os.path.join(self.path, str(guild_id)))
+        except FileNotFoundError:
+            return []
+        return sorted([f[:-len('.jsonl.gz')] for f in filenames if f.endswith('.jsonl.gz')], reverse=True)
+
+    def write(self, guild_id, rows):
+        """
+        Append rows to their months' files, and make sure they're on disk before returning, since the caller deletes
+        them from the database next.
+        """
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row['message_date'].strftime('%Y-%m'), []).append(row)
+
+        for month, month_rows in by_month.items():
+            path = self.month_path(guild_id, month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._lock:
+                if os.path.exists(path) and not os.path.exists(self.index_path(guild_id, month)):
+                    # index what's already there first, an index file only covering the new rows would hide the old ones
+                    self.month_index(guild_id, month)
+                self.committed_size(guild_id, month)
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                with gzip.GzipFile(fileobj=f, mode='ab') as gz:
+                    gz.write(''.join(encode_row(row) + '\n' for row in month_rows).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+
+            # a row that doesn't make it into the index is still found by a full read, and gets archived again
+            # (and indexed) on the next run anyway, since it hasn't been deleted from the table yet
+            with self._lock:
+                self.committed[(guild_id, month)] = end
+                index = self.indexes.get((guild_id, month))
+                with open(self.index_path(guild_id, month), 'a') as f:
+                    for row in month_rows:
+                        f.write(f"{row['message_id']} {offset} {row['user_id']}\n")
+                        if index is not None:
+                            index.add(row['message_id'], row['user_id'], offset)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def committed_size(self, guild_id, month):
+        """
+        Where the month's file ends, not counting a write in progress.  Call with the lock held.
+        """
+        key = (guild_id, month)
+        if key not in self.committed:
+            path = self.month_path(guild_id, month)
+            # nothing can be appending yet, write() records this before it starts
+            self.committed[key] = os.path.getsize(path) if os.path.exists(path) else 0
+        return self.committed[key]
+
+    def read(self, guild_id, month, user_id=None):
+        """
+        Every row archived for guild_id in month, optionally only those for user_id, which only decompresses the
+        members the index says hold user_id's rows.  A crash between archiving and deleting can archive a row twice,
+        so rows are de-duplicated by id.
+        """
+        with self._lock:
+            size = self.committed_size(guild_id, month)
+            if user_id is None:
+                offsets = None
+            else:
+                index = self.month_index(guild_id, month)
+                offsets = sorted(index.users.get(user_id, ())) if index else []
+        if not size or offsets == []:
+            return []
+
+        rows = {}
+        with open(self.month_path(guild_id, month), 'rb') as f:
+            for data in read_members(f, size, offsets):
+                for row in decode_rows(data):
+                    if user_id is None or row['user_id'] == user_id:
+                        rows[row['id']] = row
+        return list(rows.values())
+
+    def offsets(self, guild_id, month, message_id):
+        """
+        Offsets of the members of month's file holding message_id.
+        """
+        with self._lock:
+            index = self.month_index(guild_id, month)
+            return sorted(index.messages.get(message_id, ())) if index else []
+
+    def month_index(self, guild_id, month):
+        """
+        The MonthIndex of one month.  Built from the month's file if the index file is missing, or is from before
+        user_ids were indexed.  Call with the lock held.
+        """
+        key = (guild_id, month)
+        if key in self.indexes:
+            self.indexes.move_to_end(key)
+            return self.indexes[key]
+
+        path = self.month_path(guild_id, month)
+        if not os.path.exists(path):
+            return None
+
+        index = MonthIndex()
+        try:
+            with open(self.index_path(guild_id, month)) as f:
+                for line in f:
+                    message_id, offset, user_id = line.split()
+                    index.add(int(message_id), int(user_id), int(offset))
+        except (FileNotFoundError, ValueError):
+            index = MonthIndex()
+            lines = []
+            size = self.committed_size(guild_id, month)
+            with open(path, 'rb') as f:
+                offset = 0
+                while offset < size:
+                    data, next_offset = read_member(f, offset)
+                    for row in decode_rows(data):
+                        index.add(row['message_id'], row['user_id'], offset)
+                        lines.append(f"{row['message_id']} {offset} {row['user_id']}\n")
+                    offset = next_offset
+            with open(self.index_path(guild_id, month), 'w') as f:
+                f.writelines(lines)
+
+        self.indexes[key] = index
+        while len(self.indexes) > self.index_cache_size:
+            self.indexes.popitem(last=False)
+        return index
+
+    def find(self, guild_id, message_id):
+        """
+        Every archived version of message_id, oldest first.  The message's snowflake says which month it's in, and
+        the month's index which members of that file to decompress.
+        """
+        month = snowflake_time(message_id).strftime('%Y-%m')
+        offsets = self.offsets(guild_id, month, message_id)
+        if not offsets:
+            return []
+
+        rows = {}
+        with open(self.month_path(guild_id, month), 'rb') as f:
+            for offset in offsets:
+                data, _ = read_member(f, offset)
+                for row in decode_rows(data):
+                    if row['message_id'] == message_id:
+                        rows[row['id']] = row
+        return sorted(rows.values(), key=lambda row: row['id'])
+
+    def contains(self, guild_id, message_id):
+        return bool(self.offsets(guild_id, snowflake_time(message_id).strftime('%Y-%m'), message_id))
+
+    async def write_async(self, guild_id, rows):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.write, guild_id, rows)
+
+    async def read_async(self, guild_id, month, user_id=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.read, guild_id, month, user_id)
+
+    async def iter_messages(self, guild_id, user_id=None):
+        """
+        Yield archived rows for guild_id, newest message_date first, optionally only those for user_id.  Months are
+        read one at a time as they're needed, so a caller that stops early doesn't read the older ones, and a month
+        without any of user_id's rows isn't decompressed at all.
+        """
+        for month in self.months(guild_id):
+            rows = await self.read_async(guild_id, month, user_id)
+            rows.sort(key=lambda row: (row['message_date'], row['id']), reverse=True)
+            for row in rows:
+                yield row
+
+    async def get_messages(self, guild_id, message_id):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.find, guild_id, message_id)
+
+    async def contains_any(self, guild_id, message_ids):
+        """
+        The message_ids that have been archived for guild_id.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, lambda: [message_id for message_id in message_ids if self.contains(guild_id, message_id)]
+        )
+
+
+ARCHIVE = AuditArchive(os.environ.get('AUDIT_ARCHIVE_PATH', 'data/audit_archive'))
@@ -0,0 +1,184 @@
+"""
+In-process BPS delta patch encoder, so we don't need to shell out to flips for every seed.
+
+Base ROMs are memory-mapped once and shared by every patch job, along with their CRC32 and a block index that
+lets us find data the randomizer moved around.  See https://www.romhacking.net/documents/746/ for the format.
+"""
+import asyncio
+import logging
+import mmap
+import threading
+import zlib
+
+SOURCE_READ = 0
+TARGET_READ = 1
+SOURCE_COPY = 2
+TARGET_COPY = 3
+
+# size of the source blocks we index, and so the shortest relocated match we can find
+BLOCK_SIZE = 16
+
+# don't bother switching to a source read or target copy for anything shorter than this
+MIN_MATCH = 4
+
+_SOURCES = {}
+_SOURCES_LOCK = threading.Lock()
+
+
+def encode_number(number):
+    encoded = bytearray()
+    while True:
+        x = number & 0x7f
+        number >>= 7
+        if number == 0:
+            encoded.append(0x80 | x)
+            return encoded
+        encoded.append(x)
+        number -= 1
+
+
+def encode_offset(offset):
+    return encode_number((abs(offset) << 1) | (offset < 0))
+
+
+def match_length(a, a_offset, b, b_offset, limit):
+    """
+    How many bytes match between a[a_offset:] and b[b_offset:], up to limit.  Compares big memoryview slices first
+    so long matches are found without walking them a byte at a time in python.
+    """
+    length = 0
+    for step in (4096, 256, 16, 1):
+        while length + step <= limit and a[a_offset + length:a_offset + length + step] == b[b_offset + length:b_offset + length + step]:
+            length += step
+    return length
+
+
+class BpsSource():
+    """
+    A memory-mapped base ROM, its CRC32, and an index of the offset of every BLOCK_SIZE aligned block in it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.mmap)
+        self.crc32 = zlib.crc32(self.data)
+
+        self.index = {}
+        for offset in range(0, len(self.data) - BLOCK_SIZE + 1, BLOCK_SIZE):
+            self.index.setdefault(bytes(self.data[offset:offset + BLOCK_SIZE]), offset)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def get_source(path):
+    with _SOURCES_LOCK:
+        if path not in _SOURCES:
+            _SOURCES[path] = BpsSource(path)
+        return _SOURCES[path]
+
+
+def load_sources(paths):
+    """
+    Map and index base roms ahead of time so the first seed doesn't pay for it.
+    """
+    for path in paths:
+        if path:
+            get_source(path)
+
+
+def log_load_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"unable to load base roms, they'll be loaded on first use: {future.exception()!r}")
+
+
+def start_loading_sources(loop, paths):
+    """
+    Run load_sources in the background during startup, logging it if it fails.
+    """
+    future = loop.run_in_executor(None, load_sources, paths)
+    future.add_done_callback(log_load_failure)
+    return future
+
+
+def create_patch(source_path, target):
+    """
+    Create a BPS patch that turns the ROM at source_path into target (any bytes-like object).
+    """
+    source = get_source(source_path)
+    src = source.data
+    target = memoryview(target)
+    source_size = len(src)
+    target_size = len(target)
+
+    patch = bytearray(b'BPS1')
+    patch += encode_number(source_size)
+    patch += encode_number(target_size)
+    patch += encode_number(0)
+
+    source_relative_offset = 0
+    target_relative_offset = 0
+    pending = 0
+    output_offset = 0
+
+    def action(command, length):
+        patch.extend(encode_number(((length - 1) << 2) | command))
+
+    def flush_target_read():
+        nonlocal pending
+        if pending:
+            action(TARGET_READ, pending)
+            patch.extend(target[output_offset - pending:output_offset])
+            pending = 0
+
+    while output_offset < target_size:
+        remaining = target_size - output_offset
+
+        # most of a randomized rom is still exactly where it was in the base rom
+        if output_offset < source_size:
+            length = match_length(src, output_offset, target, output_offset, min(remaining, source_size - output_offset))
+            if length >= MIN_MATCH or length == remaining:
+                flush_target_read()
+                action(SOURCE_READ, length)
+                output_offset += length
+                continue
+
+        # data that was moved somewhere else
+        if remaining >= BLOCK_SIZE:
+            source_offset = source.index.get(bytes(target[output_offset:output_offset + BLOCK_SIZE]))
+            if source_offset is not None:
+                length = match_length(src, source_offset, target, output_offset, min(remaining, source_size - source_offset))
+                flush_target_read()
+                action(SOURCE_COPY, length)
+                patch.extend(encode_offset(source_offset - source_relative_offset))
+                source_relative_offset = source_offset + length
+                output_offset += length
+                continue
+
+        # runs of the same byte (or repeats of what we just wrote)
+        if output_offset > 0:
+            length = match_length(target, output_offset - 1, target, output_offset, remaining)
+            if length >= MIN_MATCH:
+                flush_target_read()
+                action(TARGET_COPY, length)
+                patch.extend(encode_offset(output_offset - 1 - target_relative_offset))
+                target_relative_offset = output_offset - 1 + length
+                output_offset += length
+                continue
+
+        pending += 1
+        output_offset += 1
+
+    flush_target_read()
+
+    patch += source.crc32.to_bytes(4, 'little')
+    patch += zlib.crc32(target).to_bytes(4, 'little')
+    patch += zlib.crc32(patch).to_bytes(4, 'little')
+    return bytes(patch)
+
+
+async def create_patch_async(source_path, target):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, create_patch, source_path, target)
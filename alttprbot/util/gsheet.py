@@ -1,7 +1,22 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+
+import gspread_asyncio
 from oauth2client.service_account import ServiceAccountCredentials
 from googleapiclient.discovery import build
 from config import Config as c
 
+# worksheet handles are kept for less time than gspread_asyncio re-authorizes after, so a cached handle never
+# outlives the credentials it was opened with
+WORKSHEET_TTL = 1800
+
+# how long a sheet's contents are served from memory before they're pulled again
+SHEET_SNAPSHOT_TTL = int(os.environ.get('SHEET_SNAPSHOT_TTL', '300'))
+
+
 def get_creds():
     return ServiceAccountCredentials.from_json_keyfile_dict(
         c.gsheet_api_oauth,
@@ -12,4 +27,129 @@ def get_creds():
         ]
     )
 
-drive_service = build('drive', 'v3', credentials=get_creds())
\ No newline at end of file
+drive_service = build('drive', 'v3', credentials=get_creds())
+
+
+# one client manager for the whole bot, it keeps the authorized client around and only re-authorizes when it has to
+AGCM = gspread_asyncio.AsyncioGspreadClientManager(get_creds)
+
+
+class WorksheetCache():
+    def __init__(self, agcm, ttl=WORKSHEET_TTL):
+        self.agcm = agcm
+        self.ttl = ttl
+        self.worksheets = {}
+        self._lock = None
+
+    async def get(self, spreadsheet_key, sheet_name):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            cached = self.worksheets.get((spreadsheet_key, sheet_name))
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+
+            agc = await self.agcm.authorize()
+            wb = await agc.open_by_key(spreadsheet_key)
+            # sheets are either looked up by title, or by position
+            if isinstance(sheet_name, int):
+                wks = await wb.get_worksheet(sheet_name)
+            else:
+                wks = await wb.worksheet(sheet_name)
+            self.worksheets[(spreadsheet_key, sheet_name)] = (time.monotonic(), wks)
+            return wks
+
+    def invalidate(self, spreadsheet_key, sheet_name):
+        self.worksheets.pop((spreadsheet_key, sheet_name), None)
+
+
+WORKSHEETS = WorksheetCache(AGCM)
+
+
+class ResultsBatch():
+    """
+    Rows bound for a spreadsheet, buffered per worksheet and written with one append_rows call per worksheet.
+    Every row carries a key (the race's id), and flush() returns the keys of the rows that actually made it to the
+    sheet, so the caller only marks those as written.
+    """
+
+    def __init__(self, spreadsheet_key):
+        self.spreadsheet_key = spreadsheet_key
+        self.rows = collections.defaultdict(list)
+        self.keys = collections.defaultdict(list)
+
+    def add(self, sheet_name, row, key):
+        self.rows[sheet_name].append(row)
+        self.keys[sheet_name].append(key)
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.rows.values())
+
+    async def flush(self):
+        written = []
+        for sheet_name, rows in self.rows.items():
+            try:
+                wks = await WORKSHEETS.get(self.spreadsheet_key, sheet_name)
+                await wks.append_rows(rows)
+            except Exception:
+                # nothing gets marked as written, so these rows are picked up again next time
+                WORKSHEETS.invalidate(self.spreadsheet_key, sheet_name)
+                logging.exception(f"Unable to write {len(rows)} results to worksheet {sheet_name}.")
+                continue
+            written += self.keys[sheet_name]
+
+        self.rows.clear()
+        self.keys.clear()
+        return written
+
+
+class SheetSnapshot():
+    """
+    Every record of a worksheet as of one get_all_records() call, with per-column indexes built on first use.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.fetched = time.monotonic()
+        self._indexes = {}
+
+    def lookup(self, column, value):
+        """
+        The first record whose column equals value, or None.  Returns a copy, the snapshot is shared.
+        """
+        if column not in self._indexes:
+            index = {}
+            for record in self.records:
+                index.setdefault(record.get(column), record)
+            self._indexes[column] = index
+        record = self._indexes[column].get(value)
+        return dict(record) if record is not None else None
+
+
+class SheetSnapshotCache():
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.snapshots = {}
+        self._locks = collections.defaultdict(asyncio.Lock)
+
+    async def get(self, spreadsheet_key, sheet_name=0, refresh=False):
+        key = (spreadsheet_key, sheet_name)
+        # one download per sheet, no matter how many lookups are waiting on it
+        async with self._locks[key]:
+            snapshot = self.snapshots.get(key)
+            if refresh or snapshot is None or time.monotonic() - snapshot.fetched >= self.ttl:
+                wks = await WORKSHEETS.get(spreadsheet_key, sheet_name)
+                snapshot = SheetSnapshot(await wks.get_all_records())
+                self.snapshots[key] = snapshot
+            return snapshot
+
+    def invalidate(self, spreadsheet_key=None):
+        if spreadsheet_key is None:
+            self.snapshots.clear()
+        else:
+            for key in [key for key in self.snapshots if key[0] == spreadsheet_key]:
+                del self.snapshots[key]
+
+
+SNAPSHOTS = SheetSnapshotCache(SHEET_SNAPSHOT_TTL)
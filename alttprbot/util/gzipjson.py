@@ -0,0 +1,88 @@
+"""
+Serialize big JSON documents (spoiler logs, mostly) straight into a gzip stream a piece at a time, so there's never a
+complete uncompressed copy of the document sitting in memory.
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+GZIP_LEVEL = int(os.environ.get('SPOILER_GZIP_LEVEL', '9'))
+JSON_INDENT = int(os.environ['SPOILER_JSON_INDENT']) if os.environ.get('SPOILER_JSON_INDENT') else 4
+
+# zlib's gzip container (wbits 16 + MAX_WBITS), same format gzip.compress writes
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# hand the compressor at least this much at a time, lots of tiny writes are slow
+CHUNK_SIZE = 64 * 1024
+
+# a newline and the indentation after it, strings can't contain a raw newline so this only matches indentation
+INDENTATION = re.compile(rb'\n( *)')
+
+
+def iter_json_chunks(document, indent=JSON_INDENT):
+    """
+    Yield the document as encoded JSON bytes, in pieces.  A dict is encoded with orjson when it's installed, one top
+    level key at a time, and everything else with the stdlib encoder.  orjson only knows how to indent by two spaces,
+    so its indentation is rewritten to indent spaces a level.  indent=0 (newlines, no indentation) goes to the stdlib.
+
+    The orjson output isn't byte for byte what json.dumps writes: indent=None has no spaces after separators,
+    non-ASCII text is written as UTF-8 instead of \\u escapes, and floats can be formatted differently (1e16 rather
+    than 1e+16).  It parses to the same document, apart from NaN and Infinity, which orjson writes as null.
+    """
+    if orjson is not None and isinstance(document, dict) and (indent is None or (isinstance(indent, int) and indent > 0)):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        if not document:
+            yield b'{}'
+            return
+
+        pad = b' ' * indent if indent else b''
+        separator = b'{\n' + pad if indent else b'{'
+        for key, value in document.items():
+            encoded = orjson.dumps(value, option=option)
+            if indent:
+                # orjson indents two spaces a level, and the value belongs one level deeper than where orjson put it
+                encoded = INDENTATION.sub(lambda m: b'\n' + pad + pad * (len(m.group(1)) // 2), encoded)
+            yield separator + orjson.dumps(str(key)) + (b': ' if indent else b':') + encoded
+            separator = b',\n' + pad if indent else b','
+        yield b'\n}' if indent else b'}'
+        return
+
+    encoder = json.JSONEncoder(indent=indent)
+    for chunk in encoder.iterencode(document):
+        yield chunk.encode('utf-8')
+
+
+def gzip_json(document, indent=JSON_INDENT, level=GZIP_LEVEL):
+    """
+    Returns a BytesIO holding the gzipped JSON, ready to be handed to storage as an upload body.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    output = io.BytesIO()
+    pending = []
+    pending_size = 0
+
+    for chunk in iter_json_chunks(document, indent=indent):
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= CHUNK_SIZE:
+            output.write(compressor.compress(b''.join(pending)))
+            pending = []
+            pending_size = 0
+
+    output.write(compressor.compress(b''.join(pending)))
+    output.write(compressor.flush())
+    output.seek(0)
+    return output
+
+
+async def gzip_json_async(document, indent=JSON_INDENT, level=GZIP_LEVEL):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, gzip_json, document, indent, level)
@@ -1,11 +1,18 @@
-import json
+import asyncio
+import bisect
+import difflib
+import logging
+import os
 from urllib.parse import urljoin
 
-import aiohttp
 import discord
 import html2markdown
 
 from alttprbot.exceptions import SahasrahBotException
+from alttprbot.util import http
+
+HOLYIMAGE_URL = 'http://alttp.mymm1.com/holyimage/holyimages.json'
+HOLYIMAGE_REFRESH_INTERVAL = int(os.environ.get('HOLYIMAGE_REFRESH_INTERVAL', '3600'))
 
 
 async def holy(slug, game='z3r'):
@@ -18,6 +25,88 @@ class HolyImageNotFound(SahasrahBotException):
     pass
 
 
+class HolyImageIndex():
+    """
+    One game's holy images, keyed by slug, alias and idx, plus a sorted list of those keys for suggestions.
+    """
+
+    def __init__(self, images):
+        self.images = {}
+        for image in images:
+            keys = [image.get('slug')] + image.get('aliases', [])
+            if 'idx' in image:
+                keys.append(str(image['idx']))
+            for key in keys:
+                # the first image to claim a key wins, same as scanning the list in order
+                if key is not None:
+                    self.images.setdefault(str(key).lower(), image)
+        self.keys = sorted(self.images)
+
+    def get(self, slug):
+        return self.images.get(slug.lower())
+
+    def suggest(self, slug, limit=3):
+        slug = slug.lower()
+        start = bisect.bisect_left(self.keys, slug)
+        suggestions = []
+        for key in self.keys[start:start + limit]:
+            if not key.startswith(slug):
+                break
+            suggestions.append(key)
+        if not suggestions:
+            suggestions = difflib.get_close_matches(slug, self.keys, n=limit)
+
+        # several keys can point at the same image, only suggest each image once, by its slug
+        slugs = []
+        for key in suggestions:
+            image_slug = self.images[key]['slug']
+            if image_slug not in slugs:
+                slugs.append(image_slug)
+        return slugs
+
+
+class HolyImageCatalog():
+    """
+    holyimages.json, indexed per game.  It's loaded on first use and refreshed in the background, so a lookup is a
+    dictionary hit rather than a download and a scan.
+    """
+
+    def __init__(self, url, refresh_interval):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.games = None
+        self._lock = None
+
+    async def load(self):
+        # always revalidate, an unchanged file only costs us a 304
+        images = await http.cached_get(self.url, 0, returntype='json')
+        self.games = {game: HolyImageIndex(game_images) for game, game_images in images.items()}
+
+    async def get_game(self, game):
+        if self.games is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self.games is None:
+                    await self.load()
+        return self.games[game]
+
+    async def refresh_forever(self):
+        while True:
+            try:
+                await self.load()
+            except Exception:
+                logging.exception("Unable to refresh the holy image catalog.")
+            await asyncio.sleep(self.refresh_interval)
+
+
+CATALOG = HolyImageCatalog(HOLYIMAGE_URL, HOLYIMAGE_REFRESH_INTERVAL)
+
+
+def start_catalog_refresh(loop):
+    loop.create_task(CATALOG.refresh_forever())
+
+
 class HolyImage():
     def __init__(self, slug, game='z3r'):
         self.slug = slug
@@ -28,15 +117,14 @@ class HolyImage():
             raise HolyImageNotFound(
                 'You must specify a holy image.  Check out <http://alttp.mymm1.com/holyimage/>')
 
-        images = await get_json('http://alttp.mymm1.com/holyimage/holyimages.json')
-        i = images[self.game]
+        index = await CATALOG.get_game(self.game)
+        image = index.get(self.slug)
 
-        try:
-            image = next(item for item in i if item["slug"] == self.slug.lower() or self.slug.lower(
-            ) in item.get("aliases", []) or self.slug.lower() == str(item["idx"]))
-        except (StopIteration, KeyError) as err:
+        if image is None:
+            suggestions = index.suggest(self.slug)
+            did_you_mean = f"  Did you mean {', '.join(f'`{s}`' for s in suggestions)}?" if suggestions else ""
             raise HolyImageNotFound(
-                'That holy image does not exist.  Check out <http://alttp.mymm1.com/holyimage/>') from err
+                f'That holy image does not exist.{did_you_mean}  Check out <http://alttp.mymm1.com/holyimage/>')
 
         self.image = image
         self.link = f"http://alttp.mymm1.com/holyimage/{self.game}-{self.image['slug']}.html"
@@ -68,11 +156,3 @@ class HolyImage():
             embed.set_footer(text=f"Created by {self.image['credit']}")
 
         return embed
-
-
-async def get_json(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            text = await resp.read()
-
-    return json.loads(text)
@@ -1,43 +1,360 @@
+"""
+The bot's one outbound HTTP client.  Every request goes through a single pooled aiohttp session, so connections to
+the same host are kept alive and reused, DNS answers are cached, and nothing pays for a fresh handshake per call.
+"""
+import asyncio
+import collections
 import json
+import logging
+import os
+import time
 
 import aiohttp
 import yaml
+from yarl import URL
+
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '30'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_LIMIT = int(os.environ.get('HTTP_LIMIT', '100'))
+HTTP_LIMIT_PER_HOST = int(os.environ.get('HTTP_LIMIT_PER_HOST', '10'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get('HTTP_KEEPALIVE_TIMEOUT', '30'))
+HTTP_DNS_CACHE_TTL = int(os.environ.get('HTTP_DNS_CACHE_TTL', '300'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_CACHE_MAX_BYTES = int(os.environ.get('HTTP_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+# only requests that are safe to send twice get retried
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = frozenset([502, 503, 504])
+RETRY_BACKOFF = 0.5
+
+
+class HostMetrics():
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return dict(
+            requests=self.requests,
+            errors=self.errors,
+            retries=self.retries,
+            average_seconds=self.seconds / self.requests if self.requests else None,
+        )
+
+
+class CacheEntry():
+    def __init__(self, status, body, encoding, etag=None, last_modified=None):
+        self.status = status
+        self.body = body
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = time.monotonic()
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def decode(self, returntype):
+        # keep the raw body and decode it for every caller, so nobody can mutate what the next caller gets back
+        if returntype == 'text':
+            return self.body.decode(self.encoding)
+        elif returntype == 'json':
+            return json.loads(self.body.decode(self.encoding))
+        elif returntype == 'binary':
+            return self.body
+        elif returntype == 'yaml':
+            return yaml.safe_load(self.body)
+
+
+class ResponseCache():
+    """
+    Cached GET responses, least recently used first out once the bodies add up to more than max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key).body)
+        self.entries[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.body)
+
+    def as_dict(self):
+        return dict(
+            entries=len(self.entries),
+            bytes=self.size,
+            hits=self.hits,
+            stale_hits=self.stale_hits,
+            misses=self.misses,
+            revalidated=self.revalidated,
+        )
+
+
+def log_revalidation_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f"background revalidation failed: {task.exception()!r}")
+
+
+def cache_key(url, params):
+    return str(URL(url).update_query(params)) if params else url
+
+
+class TokenBucket():
+    """
+    Allows rate requests per second on average, and bursts of up to capacity requests.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # waiters queue up on the lock, so tokens are handed out in order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HttpClient():
+    """
+    Owns the shared aiohttp session, created lazily on first use so it's bound to the running event loop.
+    """
+
+    def __init__(self, limit, limit_per_host, keepalive_timeout, dns_cache_ttl, timeout, connect_timeout, retries, cache_max_bytes):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.metrics = {}
+        self.cache = ResponseCache(cache_max_bytes)
+        self._revalidating = {}
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    def host_metrics(self, url):
+        host = URL(str(url)).host
+        if host not in self.metrics:
+            self.metrics[host] = HostMetrics()
+        return self.metrics[host]
+
+    async def _send(self, method, url, retries, handle, limiter=None, **kwargs):
+        """
+        Send a request, retrying as described in request(), and return whatever handle(resp) returns.  If a limiter
+        (a TokenBucket) is given, every attempt waits for a token first.
+        """
+        metrics = self.host_metrics(url)
+
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.acquire()
+            start = time.monotonic()
+            metrics.requests += 1
+            try:
+                async with self.session.request(method, url, **kwargs) as resp:
+                    if resp.status in RETRY_STATUSES and attempt < retries:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status, message=resp.reason, headers=resp.headers)
+                    return await handle(resp)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, asyncio.TimeoutError) as e:
+                metrics.errors += 1
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUSES
+                if not retryable or attempt >= retries:
+                    raise
+                attempt += 1
+                metrics.retries += 1
+                logging.info(f"retrying {method} {url} after {e!r} (attempt {attempt} of {retries})")
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            finally:
+                metrics.seconds += time.monotonic() - start
+
+    async def request(self, method, url, returntype='text', raise_for_status=True, retries=None, **kwargs):
+        """
+        Send a request and return its body, decoded according to returntype (text, json, binary, yaml or None to
+        throw it away).  Idempotent requests are retried on connection errors, timeouts and gateway errors.
+        """
+        method = method.upper()
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+
+        async def handle(resp):
+            if raise_for_status:
+                resp.raise_for_status()
+            return await read_response(resp, returntype)
+
+        return await self._send(method, url, retries, handle, **kwargs)
+
+    async def cached_get(self, url, ttl, stale_ttl=0, returntype='text', raise_for_status=True, params=None, **kwargs):
+        """
+        GET through the response cache.  Responses younger than ttl are served without touching the network.  Once a
+        response is older than that but still within another stale_ttl seconds it's served as-is while it gets
+        revalidated in the background, after that the caller waits for the revalidation.  Revalidation sends the
+        ETag and Last-Modified we got, so an unchanged resource costs a 304 instead of the whole body again.
+        """
+        key = cache_key(url, params)
+        entry = self.cache.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            age = now - entry.fetched
+            if age < ttl:
+                self.cache.hits += 1
+                return entry.decode(returntype)
+            if age < ttl + stale_ttl:
+                self.cache.stale_hits += 1
+                if key not in self._revalidating:
+                    task = asyncio.create_task(self._revalidate(key, url, params, kwargs))
+                    task.add_done_callback(log_revalidation_failure)
+                    self._revalidating[key] = task
+                return entry.decode(returntype)
+
+        # callers that miss at the same time share one fetch
+        self.cache.misses += 1
+        if key not in self._revalidating:
+            self._revalidating[key] = asyncio.create_task(self._revalidate(key, url, params, kwargs))
+        entry = await asyncio.shield(self._revalidating[key])
+
+        if raise_for_status and not entry.ok:
+            raise aiohttp.ClientResponseError(entry.request_info, entry.history, status=entry.status, message=entry.reason)
+        return entry.decode(returntype)
+
+    async def _revalidate(self, key, url, params, kwargs):
+        cached = self.cache.get(key)
+        kwargs = dict(kwargs)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        async def handle(resp):
+            if resp.status == 304 and cached is not None:
+                self.cache.revalidated += 1
+                cached.fetched = time.monotonic()
+                return cached
+            body = await resp.read()
+            entry = CacheEntry(
+                status=resp.status,
+                body=body,
+                encoding=resp.get_encoding(),
+                etag=resp.headers.get('ETag'),
+                last_modified=resp.headers.get('Last-Modified'),
+            )
+            if entry.ok:
+                self.cache.put(key, entry)
+            else:
+                # only kept around so cached_get can raise for it
+                entry.request_info, entry.history, entry.reason = resp.request_info, resp.history, resp.reason
+            return entry
+
+        try:
+            return await self._send('GET', url, self.retries, handle, params=params, headers=headers, **kwargs)
+        finally:
+            self._revalidating.pop(key, None)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def read_response(resp, returntype):
+    if returntype == 'text':
+        return await resp.text()
+    elif returntype == 'json':
+        # decode it ourselves, a lot of the APIs we talk to don't send an application/json content type
+        return json.loads(await resp.text())
+    elif returntype == 'binary':
+        return await resp.read()
+    elif returntype == 'yaml':
+        return yaml.safe_load(await resp.read())
+
+
+CLIENT = HttpClient(
+    limit=HTTP_LIMIT,
+    limit_per_host=HTTP_LIMIT_PER_HOST,
+    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=HTTP_DNS_CACHE_TTL,
+    timeout=HTTP_TIMEOUT,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    retries=HTTP_RETRIES,
+    cache_max_bytes=HTTP_CACHE_MAX_BYTES,
+)
+
+
+async def request(method, url, returntype='text', **kwargs):
+    return await CLIENT.request(method, url, returntype=returntype, **kwargs)
 
 
 async def request_generic(url, method='get', reqparams=None, data=None, header=None, auth=None, returntype='text'):
-    async with aiohttp.ClientSession(auth=None, raise_for_status=True) as session:
-        async with session.request(method.upper(), url, params=reqparams, data=data, headers=header, auth=auth) as resp:
-            if returntype == 'text':
-                return await resp.text()
-            elif returntype == 'json':
-                return json.loads(await resp.text())
-            elif returntype == 'binary':
-                return await resp.read()
-            elif returntype == 'yaml':
-                return yaml.safe_load(await resp.read())
+    return await CLIENT.request(method, url, returntype=returntype, params=reqparams, data=data, headers=header, auth=auth)
 
 
 async def request_json_post(url, data, auth=None, returntype='text'):
-    async with aiohttp.ClientSession(auth=auth, raise_for_status=True) as session:
-        async with session.post(url=url, json=data, auth=auth) as resp:
-            if returntype == 'text':
-                return await resp.text()
-            elif returntype == 'json':
-                return json.loads(await resp.text())
-            elif returntype == 'binary':
-                return await resp.read()
-            elif returntype == 'yaml':
-                return yaml.safe_load(await resp.read())
+    return await CLIENT.request('post', url, returntype=returntype, json=data, auth=auth)
 
 
 async def request_json_put(url, data, auth=None, returntype='text'):
-    async with aiohttp.ClientSession(auth=auth, raise_for_status=True) as session:
-        async with session.put(url=url, json=data, auth=auth) as resp:
-            if returntype == 'text':
-                return await resp.text()
-            elif returntype == 'json':
-                return json.loads(await resp.text())
-            elif returntype == 'binary':
-                return await resp.read()
-            elif returntype == 'yaml':
-                return yaml.safe_load(await resp.read())
+    return await CLIENT.request('put', url, returntype=returntype, json=data, auth=auth)
+
+
+async def cached_get(url, ttl, stale_ttl=0, returntype='text', **kwargs):
+    return await CLIENT.cached_get(url, ttl, stale_ttl=stale_ttl, returntype=returntype, **kwargs)
+
+
+def get_metrics():
+    return {host: metrics.as_dict() for host, metrics in CLIENT.metrics.items()}
+
+
+def get_cache_metrics():
+    return CLIENT.cache.as_dict()
+
+
+async def close():
+    await CLIENT.close()
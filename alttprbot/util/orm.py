@@ -6,6 +6,12 @@ import aiomysql
 
 __pool = None
 
+# rows per executemany call, aiomysql turns each call into a single multi-row INSERT
+EXECUTE_MANY_CHUNK_SIZE = int(os.environ.get('DB_EXECUTE_MANY_CHUNK_SIZE', '500'))
+
+# rows fetched per round trip by select_iter
+SELECT_ITER_CHUNK_SIZE = int(os.environ.get('DB_SELECT_ITER_CHUNK_SIZE', '1000'))
+
 
 async def create_pool(loop):
     logging.info('creating connection pool')
@@ -38,13 +44,42 @@ async def select(sql, args=None, size=None):
         cur = await conn.cursor(aiomysql.DictCursor)
         await cur.execute(sql.replace('?', '%s'), args or ())
         if size:
-            rs = await cur.fecthmany(size)
+            rs = await cur.fetchmany(size)
         else:
             rs = await cur.fetchall()
         await cur.close()
         return rs
 
 
+async def select_iter(sql, args=None, chunk_size=SELECT_ITER_CHUNK_SIZE):
+    """
+    Like select, but yields the rows one at a time from an unbuffered server-side cursor, fetching chunk_size rows
+    per round trip, so the whole result never has to fit in memory.  The connection stays checked out until the
+    iteration finishes, so don't do anything slow between rows.
+    """
+    global __pool
+    if __pool is None:
+        loop = asyncio.get_event_loop()
+        await create_pool(loop)
+
+    if args is None:
+        args = []
+
+    with (await __pool) as conn:
+        cur = await conn.cursor(aiomysql.SSDictCursor)
+        try:
+            await cur.execute(sql.replace('?', '%s'), args or ())
+            while True:
+                rows = await cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            # reads off whatever is left of the result, so the connection can go back to the pool
+            await cur.close()
+
+
 async def execute(sql, args=None):
     global __pool
     if __pool is None:
@@ -63,3 +98,30 @@ async def execute(sql, args=None):
         except BaseException:
             raise
         return affected
+
+
+async def execute_many(sql, args_list, chunk_size=EXECUTE_MANY_CHUNK_SIZE):
+    """
+    Run sql once per set of args in args_list, chunk_size sets per round trip.  For a plain
+    INSERT ... VALUES (%s, ...) statement each chunk becomes one multi-row INSERT, so an ON DUPLICATE KEY UPDATE
+    clause must refer to the new values with VALUES(`column`) rather than with placeholders.
+    """
+    global __pool
+    if __pool is None:
+        loop = asyncio.get_event_loop()
+        await create_pool(loop)
+
+    args_list = list(args_list)
+    if not args_list:
+        return 0
+
+    affected = 0
+    with (await __pool) as conn:
+        cur = await conn.cursor()
+        try:
+            for start in range(0, len(args_list), chunk_size):
+                await cur.executemany(sql.replace('?', '%s'), args_list[start:start + chunk_size])
+                affected += cur.rowcount
+        finally:
+            await cur.close()
+    return affected
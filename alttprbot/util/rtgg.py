@@ -0,0 +1,71 @@
+"""
+Fetching racetime.gg race data for the results recorders.
+"""
+import asyncio
+import os
+import time
+
+from alttprbot.util import http
+
+RACETIME_URL = 'https://racetime.gg'
+
+# how many rooms the recorders fetch at once
+RACE_DATA_CONCURRENCY = int(os.environ.get('RACE_DATA_CONCURRENCY', '8'))
+
+# seconds to leave a room alone after seeing it in each status, finished and cancelled rooms are always due since
+# the recorders are about to deal with them
+RECHECK_INTERVALS = {
+    'open': 300,
+    'invitational': 300,
+    'pending': 60,
+    'in_progress': 120,
+}
+DEFAULT_RECHECK_INTERVAL = 60
+
+
+class RoomStatusTracker():
+    """
+    Remembers the last status seen for each unfinished room and when it's worth looking at again.
+    """
+
+    def __init__(self, intervals, default_interval):
+        self.intervals = intervals
+        self.default_interval = default_interval
+        self.rooms = {}
+
+    def due(self, room_name, now=None):
+        if room_name not in self.rooms:
+            return True
+        return (now or time.monotonic()) >= self.rooms[room_name][1]
+
+    def seen(self, room_name, status):
+        if status in ('finished', 'cancelled'):
+            self.rooms.pop(room_name, None)
+            return
+        self.rooms[room_name] = (status, time.monotonic() + self.intervals.get(status, self.default_interval))
+
+
+TRACKER = RoomStatusTracker(RECHECK_INTERVALS, DEFAULT_RECHECK_INTERVAL)
+
+
+async def get_race_data(room_name):
+    race_data = await http.request_generic(f"{RACETIME_URL}/{room_name}/data", returntype='json')
+    TRACKER.seen(room_name, race_data['status']['value'])
+    return race_data
+
+
+async def get_due_race_data(room_names, concurrency=RACE_DATA_CONCURRENCY):
+    """
+    Fetch the race data of every room that's due a check, at most concurrency at a time.  Returns a dict of room
+    name to race data, or to the exception raised while fetching it.  Rooms that aren't due are left out.
+    """
+    now = time.monotonic()
+    due = [room_name for room_name in room_names if TRACKER.due(room_name, now)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(room_name):
+        async with semaphore:
+            return await get_race_data(room_name)
+
+    results = await asyncio.gather(*[fetch(room_name) for room_name in due], return_exceptions=True)
+    return dict(zip(due, results))
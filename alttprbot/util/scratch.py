@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+
+def get_scratch_dir():
+    """
+    Where randomizers that can only talk to us through files should write them.  Prefer a tmpfs so a seed's rom,
+    spoiler and settings never actually hit the disk.
+    """
+    scratch_dir = os.environ.get('GENERATION_SCRATCH_DIR')
+    if scratch_dir:
+        return scratch_dir
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+SCRATCH_DIR = get_scratch_dir()
+
+
+def scratch_directory():
+    return tempfile.TemporaryDirectory(dir=SCRATCH_DIR, prefix='sahasrahbot_')
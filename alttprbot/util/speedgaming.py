@@ -1,14 +1,36 @@
+import asyncio
 import json
+import os
 from datetime import timedelta, datetime
 
 import aiofiles
-import aiohttp
+import dateutil.parser
 import pytz
 import logging
 
 from alttprbot.exceptions import SahasrahBotException
+from alttprbot.util import http
 from config import Config as c
 
+# how long SpeedGaming responses are served from the cache, and how long after that they may be served while refreshing
+SG_SCHEDULE_TTL = 60
+SG_SCHEDULE_STALE_TTL = 240
+SG_EPISODE_TTL = 30
+SG_EPISODE_STALE_TTL = 90
+
+# schedule windows are widened to multiples of this, so the same request (and cache entry) is made for a while
+# instead of a new one every time the clock ticks over
+SG_SCHEDULE_WINDOW_STEP = timedelta(minutes=15)
+
+# keeps SG's API from getting rekt, shared by everything that talks to it
+SG_API_LIMITER = http.TokenBucket(
+    rate=float(os.environ.get('SG_API_RATE', '2')),
+    capacity=int(os.environ.get('SG_API_BURST', '5')),
+)
+
+# how many race rooms a schedule scan may be creating at once
+SG_ROOM_CONCURRENCY = int(os.environ.get('SG_ROOM_CONCURRENCY', '4'))
+
 
 class SGEpisodeNotFoundException(SahasrahBotException):
     pass
@@ -31,21 +53,21 @@ async def get_upcoming_episodes_by_event(event, hours_past=4, hours_future=4):
     sched_to = now + timedelta(hours=hours_future)
     params = {
         'event': event,
-        'from': sched_from.isoformat(),
-        'to': sched_to.isoformat()
+        'from': floor_to_step(sched_from).isoformat(),
+        'to': (floor_to_step(sched_to) + SG_SCHEDULE_WINDOW_STEP).isoformat()
     }
-    async with aiohttp.request(
-        method='get',
-        url=f'{c.SgApiEndpoint}/schedule',
-        params=params,
-    ) as resp:
-        logging.info(resp.url)
-        schedule = await resp.json(content_type='text/html')
+    logging.info(f'{c.SgApiEndpoint}/schedule {params}')
+    schedule = await http.cached_get(f'{c.SgApiEndpoint}/schedule', SG_SCHEDULE_TTL, stale_ttl=SG_SCHEDULE_STALE_TTL, returntype='json', raise_for_status=False, limiter=SG_API_LIMITER, params=params)
 
     if 'error' in schedule:
         raise SGEventNotFoundException(f"Unable to retrieve schedule for {event}. {schedule.get('error')}")
 
-    return schedule
+    # trim the widened window back to the one asked for
+    return [episode for episode in schedule if 'when' not in episode or sched_from <= dateutil.parser.parse(episode['when']) <= sched_to]
+
+
+def floor_to_step(when):
+    return when - (when - when.replace(hour=0, minute=0, second=0, microsecond=0)) % SG_SCHEDULE_WINDOW_STEP
 
 
 async def get_episode(episodeid: int, complete=False):
@@ -63,19 +85,9 @@ async def get_episode(episodeid: int, complete=False):
         elif episodeid == 0:
             result = {"error": "Failed to find episode with id 0."}
         else:
-            async with aiohttp.request(
-                method='get',
-                url=f'{c.SgApiEndpoint}/episode',
-                params={'id': episodeid},
-            ) as resp:
-                result = await resp.json(content_type='text/html')
+            result = await http.cached_get(f'{c.SgApiEndpoint}/episode', SG_EPISODE_TTL, stale_ttl=SG_EPISODE_STALE_TTL, returntype='json', raise_for_status=False, limiter=SG_API_LIMITER, params={'id': episodeid})
     else:
-        async with aiohttp.request(
-            method='get',
-            url=f'{c.SgApiEndpoint}/episode',
-            params={'id': episodeid},
-        ) as resp:
-            result = await resp.json(content_type='text/html')
+        result = await http.cached_get(f'{c.SgApiEndpoint}/episode', SG_EPISODE_TTL, stale_ttl=SG_EPISODE_STALE_TTL, returntype='json', raise_for_status=False, limiter=SG_API_LIMITER, params={'id': episodeid})
 
     if 'error' in result:
         raise SGEpisodeNotFoundException(result["error"])
@@ -84,3 +96,31 @@ async def get_episode(episodeid: int, complete=False):
     #     raise SGEpisodeNotFoundException('Not an alttpr tournament race.')
 
     return result
+
+
+async def scan_schedules(windows):
+    """
+    Fetch the upcoming episodes of several events at once.  windows maps each event slug to its (hours_past,
+    hours_future), and the result maps each event slug to its list of episodes, or to the exception raised while
+    fetching it.
+    """
+    results = await asyncio.gather(
+        *[get_upcoming_episodes_by_event(event, hours_past=hours_past, hours_future=hours_future)
+          for event, (hours_past, hours_future) in windows.items()],
+        return_exceptions=True
+    )
+    return dict(zip(windows, results))
+
+
+async def run_bounded(jobs, func, concurrency=SG_ROOM_CONCURRENCY):
+    """
+    Await func(job) for every job, no more than concurrency of them at a time.  Returns the results in job order,
+    exceptions included, so func should handle (and report) its own errors.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with semaphore:
+            return await func(job)
+
+    return await asyncio.gather(*[run(job) for job in jobs], return_exceptions=True)
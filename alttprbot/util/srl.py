@@ -7,6 +7,9 @@ from config import Config as c
 
 from . import http
 
+SRL_RACE_TTL = 10
+SRL_RACE_STALE_TTL = 20
+
 
 async def get_race(raceid, complete=False):
     # if we're developing locally, we want to have some artifical data to use that isn't from SRL
@@ -23,7 +26,7 @@ async def get_race(raceid, complete=False):
         elif raceid == 'rip':
             return {}
 
-    return await http.request_generic(f'http://api.speedrunslive.com/races/{raceid}', returntype='json')
+    return await http.cached_get(f'http://api.speedrunslive.com/races/{raceid}', SRL_RACE_TTL, stale_ttl=SRL_RACE_STALE_TTL, returntype='json')
 
 
 def srl_race_id(channel):
@@ -34,7 +37,7 @@ def srl_race_id(channel):
 
 
 async def get_all_races():
-    return await http.request_generic(f'http://api.speedrunslive.com/races', returntype='json')
+    return await http.cached_get('http://api.speedrunslive.com/races', SRL_RACE_TTL, stale_ttl=SRL_RACE_STALE_TTL, returntype='json')
 
 
 async def get_player(player):
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import time
+
+import aioboto3
+import aiofiles
+from botocore.config import Config as BotoConfig
+
+
+def body_size(body):
+    # bodies are either bytes-like or a BytesIO we built the object in
+    if hasattr(body, 'getbuffer'):
+        return body.getbuffer().nbytes
+    return len(body)
+
+
+class UploadMetrics():
+    def __init__(self):
+        self.uploads = 0
+        self.failures = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def record(self, size, seconds):
+        self.uploads += 1
+        self.bytes += size
+        self.seconds += seconds
+
+    def as_dict(self):
+        return dict(
+            uploads=self.uploads,
+            failures=self.failures,
+            bytes=self.bytes,
+            average_seconds=self.seconds / self.uploads if self.uploads else None,
+        )
+
+
+class S3Storage():
+    """
+    Owns a single S3 client for the whole process, so uploads reuse its connection pool instead of paying for
+    client construction and a TLS handshake every time.
+    """
+
+    def __init__(self, max_pool_connections=20):
+        self.max_pool_connections = max_pool_connections
+        self.metrics = UploadMetrics()
+        self._context = None
+        self._client = None
+        self._lock = None
+
+    async def client(self):
+        if self._client is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._client is None:
+                    self._context = aioboto3.client('s3', config=BotoConfig(max_pool_connections=self.max_pool_connections))
+                    self._client = await self._context.__aenter__()
+        return self._client
+
+    async def put_object(self, bucket, key, body, **kwargs):
+        client = await self.client()
+        start = time.monotonic()
+        try:
+            await client.put_object(Bucket=bucket, Key=key, Body=body, **kwargs)
+        except Exception:
+            self.metrics.failures += 1
+            raise
+        elapsed = time.monotonic() - start
+        size = body_size(body)
+        self.metrics.record(size, elapsed)
+        logging.debug(f"uploaded {size} bytes to s3://{bucket}/{key} in {elapsed:.3f}s")
+
+    async def close(self):
+        if self._context is not None:
+            await self._context.__aexit__(None, None, None)
+            self._context = None
+            self._client = None
+
+
+class FilesystemStorage():
+    """
+    Writes objects to STORAGE_LOCAL_PATH/<bucket>/<key> instead of S3, for running the bot locally.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.metrics = UploadMetrics()
+
+    async def put_object(self, bucket, key, body, **kwargs):
+        start = time.monotonic()
+        path = os.path.join(self.path, bucket or 'default', key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        async with aiofiles.open(path, 'wb') as f:
+            await f.write(body.getbuffer() if hasattr(body, 'getbuffer') else body)
+        self.metrics.record(body_size(body), time.monotonic() - start)
+
+    async def close(self):
+        pass
+
+
+async def put_objects(*uploads):
+    """
+    Upload several objects at once, each upload is a dict of put_object keyword arguments.
+    """
+    await asyncio.gather(*[STORAGE.put_object(**upload) for upload in uploads])
+
+
+def get_metrics():
+    return STORAGE.metrics.as_dict()
+
+
+if os.environ.get('STORAGE_BACKEND', 's3') == 'filesystem':
+    STORAGE = FilesystemStorage(os.environ.get('STORAGE_LOCAL_PATH', 'data/storage'))
+else:
+    STORAGE = S3Storage(max_pool_connections=int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '20')))
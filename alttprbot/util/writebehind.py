@@ -0,0 +1,186 @@
+import asyncio
+import logging
+
+
+class WriteBehindQueue():
+    """
+    Holds rows in memory and hands them to write_rows(rows) in batches, once max_rows rows are waiting or max_delay
+    seconds after the last write, whichever comes first.
+
+    No more than max_pending rows are held.  When the queue is full put() waits up to put_timeout seconds for a
+    write to make room, and after that the row is dropped (and counted) rather than letting memory grow.
+
+    A batch that fails is retried on the next flush.  Once the same rows have failed max_attempts times in a row
+    they're written one at a time, and any the database still won't take are logged and rejected, so one bad row
+    can't hold up everything queued behind it.
+    """
+
+    def __init__(self, write_rows, max_rows=200, max_delay=1.0, max_pending=20000, put_timeout=5.0, max_attempts=3, name='queue'):
+        self.write_rows = write_rows
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        self.name = name
+
+        self.rows = []
+        self.writing = []
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failures = 0
+        self.rejected = 0
+        # failed writes in a row, of the rows at the front of the queue
+        self.attempts = 0
+
+        self._task = None
+        self._wakeup = None
+        self._room = None
+        self._lock = None
+
+    def _start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._room = asyncio.Condition()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, row):
+        """
+        Queue a row, returns False if it had to be dropped.
+        """
+        self._start()
+
+        if len(self.rows) >= self.max_pending:
+            self._wakeup.set()
+            try:
+                async with self._room:
+                    await asyncio.wait_for(
+                        self._room.wait_for(lambda: len(self.rows) < self.max_pending),
+                        timeout=self.put_timeout
+                    )
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                return False
+
+        self.rows.append(row)
+        if len(self.rows) >= self.max_rows:
+            self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception(f"{self.name} - flush failed")
+
+    async def flush(self):
+        """
+        Write everything queued so far.  Also waits for any write already in progress, so once this returns every
+        row put() before the call is in the database (or was dropped).
+        """
+        if self._lock is None:
+            return
+
+        async with self._lock:
+            while self.rows:
+                batch = self.rows[:self.max_rows]
+                del self.rows[:self.max_rows]
+                async with self._room:
+                    self._room.notify_all()
+
+                self.writing = batch
+                try:
+                    if self.attempts < self.max_attempts:
+                        await self.write_rows(batch)
+                        written = len(batch)
+                    else:
+                        written = await self._write_each(batch)
+                except Exception:
+                    self.failures += 1
+                    self.attempts += 1
+                    # put the batch back for the next flush, as much of it as there's room for
+                    room = max(0, self.max_pending - len(self.rows))
+                    self.rows[0:0] = batch[:room]
+                    self.dropped += len(batch) - min(room, len(batch))
+                    raise
+                finally:
+                    self.writing = []
+
+                self.attempts = 0
+                self.batches += 1
+                self.written += written
+
+    async def _write_each(self, batch):
+        """
+        Write a batch that keeps failing one row at a time, rejecting the rows that fail.  If every row fails it's
+        more likely the database than the rows, so the last error is raised and nothing is rejected.
+        """
+        rejected = []
+        error = None
+        for row in batch:
+            try:
+                await self.write_rows([row])
+            except Exception as e:
+                rejected.append(row)
+                error = e
+
+        if rejected and len(rejected) == len(batch) and len(batch) > 1:
+            # the rows that did go in are gone from the batch
+            raise error
+
+        for row in rejected:
+            logging.error(f"{self.name} - rejected {row!r}", exc_info=error)
+        self.rejected += len(rejected)
+        return len(batch) - len(rejected)
+
+    def find(self, match):
+        """
+        The rows that haven't been written yet, including any being written right now, that match(row) is true for,
+        oldest first.
+        """
+        return [row for row in self.writing + self.rows if match(row)]
+
+    def replace(self, match, func):
+        """
+        Swap every waiting row that match(row) is true for with func(row).  Rows already being written can't be
+        changed, returns how many of those matched, wait_written() and then look in the database for them.
+        """
+        for i, row in enumerate(self.rows):
+            if match(row):
+                self.rows[i] = func(row)
+        return len([row for row in self.writing if match(row)])
+
+    async def wait_written(self):
+        """
+        Wait for the write in progress, if any, without writing anything else.
+        """
+        if self._lock is not None and self._lock.locked():
+            async with self._lock:
+                pass
+
+    async def close(self):
+        if self._task is not None:
+            # hold the lock so the background task can't be cancelled halfway through writing a batch
+            async with self._lock:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+                self._task = None
+        await self.flush()
+
+    def metrics(self):
+        return dict(
+            queue_depth=len(self.rows),
+            written=self.written,
+            dropped=self.dropped,
+            batches=self.batches,
+            failures=self.failures,
+            rejected=self.rejected,
+        )
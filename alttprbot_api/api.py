@@ -1,45 +1,72 @@
+import json
 import os
+import random
 
-from quart import Quart, abort, jsonify, request
+from quart import Quart, Response, abort, jsonify, request
 
-from alttprbot.alttprgen.mystery import get_weights, generate
+from alttprbot.alttprgen import seedpool
+from alttprbot.alttprgen.mystery import get_compiled_weights, generate
+from alttprbot.alttprgen.weightsampler import CompiledWeightset
 from alttprbot.tournament import league, alttpr
-from alttprbot.database import league_playoffs
+from alttprbot.database import audit, league_playoffs
+from alttprbot.util import http, storage
 from alttprbot_discord.bot import discordbot
 from alttprbot_srl.bot import srlbot
 
 sahasrahbotapi = Quart(__name__)
 
 
+MYSTERY_BATCH_MAX = 1000
+
+
 @sahasrahbotapi.route('/api/settingsgen/mystery', methods=['POST'])
 async def mysterygen():
-    weights = await request.get_json()
+    weights = CompiledWeightset(await request.get_json())
+    if 'count' in request.args:
+        return mysterygen_batch(weights)
+
     settings, customizer, doors = await generate(weights=weights, spoilers="mystery")
-    if customizer:
-        endpoint = '/api/customizer'
-    elif doors:
-        endpoint = None
-    else:
-        endpoint = '/api/randomizer'
-    return jsonify(
-        settings=settings,
-        customizer=customizer,
-        doors=doors,
-        endpoint=endpoint
-    )
+    return jsonify(**mystery_result(settings, customizer, doors))
 
 
 @sahasrahbotapi.route('/api/settingsgen/mystery/<string:weightset>', methods=['GET'])
 async def mysterygenwithweights(weightset):
-    weights = await get_weights(weightset)
+    weights = await get_compiled_weights(weightset)
+    if 'count' in request.args:
+        return mysterygen_batch(weights)
+
     settings, customizer, doors = await generate(weights=weights, spoilers="mystery")
+    return jsonify(**mystery_result(settings, customizer, doors))
+
+
+def mysterygen_batch(weights):
+    try:
+        count = int(request.args['count'])
+        seed = int(request.args['seed']) if 'seed' in request.args else None
+    except ValueError:
+        abort(400, description="count and seed must be integers")
+
+    if not 1 <= count <= MYSTERY_BATCH_MAX:
+        abort(400, description=f"count must be between 1 and {MYSTERY_BATCH_MAX}")
+
+    rng = random.Random(seed)
+
+    async def rolls():
+        for _ in range(count):
+            settings, customizer, doors = await generate(weights=weights, spoilers="mystery", rng=rng)
+            yield json.dumps(mystery_result(settings, customizer, doors)) + '\n'
+
+    return Response(rolls(), mimetype='application/x-ndjson')
+
+
+def mystery_result(settings, customizer, doors):
     if customizer:
         endpoint = '/api/customizer'
     elif doors:
         endpoint = None
     else:
         endpoint = '/api/randomizer'
-    return jsonify(
+    return dict(
         settings=settings,
         customizer=customizer,
         doors=doors,
@@ -103,6 +130,26 @@ async def get_league_playoffs():
     return jsonify(results)
 
 
+@sahasrahbotapi.route('/api/seedpool/metrics', methods=['GET'])
+async def seedpool_metrics():
+    return jsonify(pools=seedpool.get_metrics())
+
+
+@sahasrahbotapi.route('/api/storage/metrics', methods=['GET'])
+async def storage_metrics():
+    return jsonify(storage.get_metrics())
+
+
+@sahasrahbotapi.route('/api/audit/metrics', methods=['GET'])
+async def audit_metrics():
+    return jsonify(messages=audit.MESSAGE_WRITER.metrics(), archived_deletions=audit.DELETION_WRITER.metrics())
+
+
+@sahasrahbotapi.route('/api/http/metrics', methods=['GET'])
+async def http_metrics():
+    return jsonify(hosts=http.get_metrics(), cache=http.get_cache_metrics())
+
+
 @sahasrahbotapi.route('/healthcheck', methods=['GET'])
 async def healthcheck():
     if discordbot.is_closed():
@@ -1,7 +1,6 @@
 import io
 import json
 
-import aiohttp
 import discord
 import yaml
 from discord.ext import commands
@@ -9,11 +8,13 @@ from z3rsramr import parse_sram  # pylint: disable=no-name-in-module
 
 import pyz3r
 from pyz3r.ext.priestmode import create_priestmode
-from alttprbot.alttprgen.mystery import (generate_random_game)
+from alttprbot.alttprgen.mystery import (generate_random_game, get_compiled_weights)
+from alttprbot.alttprgen.mysteryanalyzer import analyze_weightset_in_process, ANALYZER_DEFAULT_ROLLS, ANALYZER_MAX_ROLLS
 from alttprbot.alttprgen.preset import get_preset, generate_preset
 from alttprbot.alttprgen.spoilers import generate_spoiler_game, generate_spoiler_game_custom
 from alttprbot.database import audit, config
 from alttprbot.exceptions import SahasrahBotException
+from alttprbot.util import http
 from alttprbot_discord.util.alttpr_discord import alttpr, alttprDiscordClass
 
 from ..util import checks
@@ -227,6 +228,31 @@ class AlttprGen(commands.Cog):
         else:
             raise SahasrahBotException("You must supply a valid yaml file.")
 
+    @commands.command(
+        brief='Show the real odds of a mystery weightset.',
+        help=(
+            'Roll a mystery weightset many times without generating games, and report how often each setting comes up.  '
+            f'Attach a yaml file to analyze custom weights.  {ANALYZER_DEFAULT_ROLLS} rolls takes about 5 seconds for weighted '
+            f'and 20 for chaos, and at most {ANALYZER_MAX_ROLLS} rolls are allowed.'
+        )
+    )
+    @commands.cooldown(rate=5, per=900, type=commands.BucketType.user)
+    @checks.restrict_to_channels_by_guild_config('AlttprGenRestrictChannels')
+    async def mysteryanalyze(self, ctx, weightset='weighted', rolls: int = ANALYZER_DEFAULT_ROLLS):
+        if not 1 <= rolls <= ANALYZER_MAX_ROLLS:
+            raise SahasrahBotException(f"Number of rolls must be between 1 and {ANALYZER_MAX_ROLLS}.")
+
+        if ctx.message.attachments:
+            content = await ctx.message.attachments[0].read()
+            weights = yaml.safe_load(content)
+            weightset = 'custom'
+        else:
+            weights = await get_compiled_weights(weightset)
+
+        analysis = await analyze_weightset_in_process(weights, rolls=rolls)
+
+        await ctx.reply(file=discord.File(io.StringIO(analysis.report()), filename=f"{weightset}_analysis.txt"))
+
     @commands.command(
         brief='Verify a game was generated by SahasrahBot.',
         help='Verify a game was generated by SahasrahBot.\nThis can be useful for checking that customizer games are not a plando or something like that if you accept viewer games as a streamer.'
@@ -421,11 +447,7 @@ async def randomgame(ctx, weightset=None, weights=None, tournament=True, spoiler
 
 
 async def get_customizer_json(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            text = await resp.read()
-
-    return json.loads(text)
+    return await http.request_generic(url, returntype='json')
 
 
 def setup(bot):
@@ -1,49 +1,80 @@
+import asyncio
+import collections
 import datetime
+import logging
+import re
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from alttprbot.database import audit, config
-import io
-from contextlib import closing
 import csv
+import gzip
+import tempfile
+
+
+SEARCH_PAGE_SIZE = 10
+SEARCH_FILTERS = ['user', 'channel', 'after', 'before', 'deleted', 'page']
 
 
 class Audit(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        # self.clean_history.start()
+        self.archive_history.start()
+
+    def cog_unload(self):
+        self.archive_history.cancel()
+        asyncio.create_task(audit.MESSAGE_WRITER.close())
+        asyncio.create_task(audit.DELETION_WRITER.close())
 
     @commands.command()
     @commands.has_guild_permissions(manage_messages=True)
     async def messagehistory(self, ctx, member: discord.Member, limit=500):
-        messages = await audit.get_messages_for_user(guild_id=ctx.guild.id, user_id=member.id, limit=limit)
-
-        fields = ['message_date', 'content', 'attachment', 'deleted']
-        with closing(io.StringIO()) as sio:
-            writer = csv.DictWriter(sio, fieldnames=fields)
-            writer.writeheader()
-            writer.writerows(messages)
-            sio.seek(0)
+        messages = audit.iter_messages_for_user(guild_id=ctx.guild.id, user_id=member.id, limit=limit)
+
+        with tempfile.TemporaryFile() as fp:
+            await write_history_csv(messages, fp)
             discord_file = discord.File(
-                fp=sio, filename=f"{member.id}_history.csv")
+                fp=fp, filename=f"{member.id}_history.csv.gz")
             await ctx.reply(file=discord_file)
 
     @commands.command()
     @commands.has_guild_permissions(manage_messages=True)
     async def deletedhistory(self, ctx, member: discord.Member, limit=500):
-        messages = await audit.get_deleted_messages_for_user(guild_id=ctx.guild.id, user_id=member.id, limit=limit)
-
-        fields = ['message_date', 'content', 'attachment', 'deleted']
-        with closing(io.StringIO()) as sio:
-            writer = csv.DictWriter(sio, fieldnames=fields)
-            writer.writeheader()
-            writer.writerows(messages)
-            sio.seek(0)
+        messages = audit.iter_deleted_messages_for_user(guild_id=ctx.guild.id, user_id=member.id, limit=limit)
+
+        with tempfile.TemporaryFile() as fp:
+            await write_history_csv(messages, fp)
             discord_file = discord.File(
-                fp=sio, filename=f"{member.id}_deleted.csv")
+                fp=fp, filename=f"{member.id}_deleted.csv.gz")
             await ctx.reply(file=discord_file)
 
+    @commands.command(
+        brief='Search the audit log for messages.',
+        help=(
+            'Search logged messages in this server, newest first.  Narrow the search with user:@member, '
+            'channel:#channel, after:YYYY-MM-DD, before:YYYY-MM-DD and deleted:yes or deleted:no, '
+            'and use page:2 and so on to see more results.  All words must match, or use MySQL boolean mode '
+            'syntax like "exact phrase" or -word.  Words shorter than three letters are ignored, and messages '
+            'older than the retention window aren\'t searched.'
+        )
+    )
+    @commands.has_guild_permissions(manage_messages=True)
+    async def auditsearch(self, ctx, *, terms):
+        query, filters = parse_search_terms(terms)
+        if not query:
+            raise commands.BadArgument('You must specify something to search for.')
+
+        page = filters.pop('page', 1)
+        messages = await audit.search_messages(
+            guild_id=ctx.guild.id,
+            query=query,
+            limit=SEARCH_PAGE_SIZE + 1,
+            offset=(page - 1) * SEARCH_PAGE_SIZE,
+            **filters
+        )
+        await ctx.reply(embed=audit_embed_search(ctx.guild, query, messages[:SEARCH_PAGE_SIZE], page, len(messages) > SEARCH_PAGE_SIZE))
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.id == self.bot.user.id:
@@ -75,48 +106,58 @@ class Audit(commands.Cog):
                     guild.channels, id=int(audit_channel_id))
 
                 await audit_channel.send(embed=embed)
-                await audit.set_deleted(payload.message_id)
+                await audit.set_deleted(payload.message_id, guild_id=guild.id)
 
-    # @commands.Cog.listener()
-    # async def on_raw_bulk_message_delete(self, payload):
-    #     if payload.guild_id is None:
-    #         return
-    #     guild = self.bot.get_guild(payload.guild_id)
-    #     channel = self.bot.get_channel(payload.channel_id)
-    #     # if payload.message_id == self.bot.user.id:
-    #     #     return
-    #     if await config.get(guild.id, 'AuditLogging') == 'true':
-    #         audit_channel_id = await config.get(guild.id, 'AuditLogChannel')
-    #         for message_id in payload.message_ids:
-    #             if audit_channel_id:
-    #                 embed = await audit_embed_delete(guild, channel, message_id)
-    #                 audit_channel = discord.utils.get(
-    #                     guild.channels, id=int(audit_channel_id))
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        if payload.guild_id is None:
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        channel = self.bot.get_channel(payload.channel_id)
 
-    #                 await audit_channel.send(embed=embed)
-    #                 await audit.set_deleted(payload.message_id)
+        # ignore these channels for reasons
+        if channel and channel.id in [694710452478803968, 694710286455930911]:
+            return
+
+        if await config.get(guild.id, 'AuditLogging') == 'true':
+            message_ids = list(payload.message_ids)
+            audit_channel_id = await config.get(guild.id, 'AuditLogChannel')
+            if audit_channel_id:
+                old_messages = await audit.get_latest_messages(message_ids, guild_id=guild.id)
+                embed = audit_embed_bulk_delete(channel, message_ids, old_messages)
+                audit_channel = discord.utils.get(
+                    guild.channels, id=int(audit_channel_id))
+
+                await audit_channel.send(embed=embed)
+                await audit.set_deleted_many(message_ids, guild_id=guild.id)
 
     @commands.Cog.listener()
     async def on_raw_message_edit(self, payload):
-        channel = self.bot.get_channel(payload.channel_id)
-        if isinstance(channel, discord.DMChannel):
+        # everything we need is in the gateway payload, so there's no need to fetch the message again
+        data = payload.data
+        if data.get('guild_id') is None:
             return
-        message = await channel.fetch_message(payload.message_id)
-        if message.author.id == self.bot.user.id:
+
+        # embed-only updates (like a link preview loading) don't carry content, and aren't edits
+        if 'content' not in data or 'author' not in data:
             return
-        if await config.get(message.guild.id, 'AuditLogging') == 'true':
-            old_message = await audit.get_cached_messages(message.id)
-            if old_message[-1]['content'] == message.content:
+
+        if int(data['author']['id']) == self.bot.user.id:
+            return
+        guild = self.bot.get_guild(int(data['guild_id']))
+        if await config.get(guild.id, 'AuditLogging') == 'true':
+            old_message = await audit.get_latest_message(payload.message_id, guild_id=guild.id)
+            if old_message is not None and old_message['content'] == data['content']:
                 return
-            audit_channel_id = await config.get(message.guild.id, 'AuditLogChannel')
+            audit_channel_id = await config.get(guild.id, 'AuditLogChannel')
             if audit_channel_id:
-                embed = await audit_embed_edit(old_message, message)
+                embed = await audit_embed_edit(old_message, guild, data)
                 audit_channel = discord.utils.get(
-                    message.guild.channels, id=int(audit_channel_id))
+                    guild.channels, id=int(audit_channel_id))
 
                 await audit_channel.send(embed=embed)
 
-            await record_message(message)
+            await record_edit(guild, data)
 
     # @commands.Cog.listener()
     # async def on_reaction_clear(self, message, reactions):
@@ -214,10 +255,24 @@ class Audit(commands.Cog):
     #     if await config.get(guild.id, 'AuditLogging') == 'true':
     #         logging.info("member unban")
 
-    # @tasks.loop(minutes=1, reconnect=True)
-    # async def clean_history(self):
-    #     logging.info('history cleaned')
-    #     await audit.clean_history()
+    @tasks.loop(hours=6, reconnect=True)
+    async def archive_history(self):
+        for guild in self.bot.guilds:
+            retention_days = int(await config.get(guild.id, 'AuditRetentionDays', audit.AUDIT_RETENTION_DAYS))
+            if retention_days <= 0:
+                continue
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+            try:
+                moved = await audit.archive_messages(guild.id, cutoff)
+            except Exception:
+                logging.exception(f"unable to archive audit messages for {guild.id}")
+                continue
+            if moved:
+                logging.info(f"archived {moved} audit messages for {guild.id}")
+
+    @archive_history.before_loop
+    async def before_archive_history(self):
+        await self.bot.wait_until_ready()
 
 # async def audit_embed_member_joined(member):
 #     embed = discord.Embed(
@@ -263,18 +318,20 @@ async def audit_embed_member_banned(member):
     return embed
 
 
-async def audit_embed_edit(old_message, message):
+async def audit_embed_edit(old_message, guild, data):
     if not old_message:
         old_content = '??? err unknown ???'
     else:
-        old_content = old_message[-1]['content']
+        old_content = old_message['content']
 
     old_content = '*empty*' if old_content == '' else old_content
-    new_content = '*empty*' if message.content == '' else message.content
+    new_content = '*empty*' if data['content'] == '' else data['content']
+
+    jump_url = f"https://discord.com/channels/{guild.id}/{data['channel_id']}/{data['id']}"
 
     embed = discord.Embed(
         title="Message Edited",
-        description=f"**A message from {message.author.mention} was edited in {message.channel.mention}.** [Jump to Message]({message.jump_url})",
+        description=f"**A message from <@{data['author']['id']}> was edited in <#{data['channel_id']}>.** [Jump to Message]({jump_url})",
         color=discord.Colour.dark_orange(),
         timestamp=datetime.datetime.now()
     )
@@ -289,17 +346,18 @@ async def audit_embed_edit(old_message, message):
 
 
 async def audit_embed_delete(guild, channel, message_id, bulk=False):
-    old_message = await audit.get_cached_messages(message_id)
+    old_message = await audit.get_latest_message(message_id, guild_id=guild.id)
     if old_message is None:
         author = None
         old_content = '*unknown*'
         old_attachment_url = None
         original_timestamp = '*unknown*'
     else:
-        author = guild.get_member(int(old_message[-1]['user_id']))
-        old_content = old_message[-1]['content']
-        old_attachment_url = old_message[-1]['attachment']
-        original_timestamp = f"{old_message[0]['message_date']} UTC"
+        author = guild.get_member(int(old_message['user_id']))
+        old_content = old_message['content']
+        old_attachment_url = old_message['attachment']
+        # every version of a message is logged with the date it was first sent
+        original_timestamp = f"{old_message['message_date']} UTC"
 
     old_content = '*empty*' if old_content == '' else old_content
 
@@ -322,8 +380,107 @@ async def audit_embed_delete(guild, channel, message_id, bulk=False):
     return embed
 
 
+def audit_embed_bulk_delete(channel, message_ids, old_messages):
+    embed = discord.Embed(
+        title="Bulk Message Deleted",
+        description=f"**{len(message_ids)} messages were deleted in {'an unknown channel' if channel is None else channel.mention}.**",
+        color=discord.Colour.dark_red(),
+        timestamp=datetime.datetime.now()
+    )
+
+    authors = collections.Counter(message['user_id'] for message in old_messages)
+    author_lines = [f"<@{user_id}>: {count}" for user_id, count in authors.most_common(10)]
+    if len(authors) > 10:
+        author_lines.append(f"...and {len(authors) - 10} more")
+    not_logged = len(message_ids) - len(old_messages)
+    if not_logged:
+        author_lines.append(f"*not logged*: {not_logged}")
+    embed.add_field(name='Authors', value='\n'.join(author_lines), inline=False)
+
+    # as many of the old messages as will fit in one field
+    message_lines = []
+    length = 0
+    for message in old_messages:
+        content = message['content'] or message['attachment'] or '*empty*'
+        line = f"<@{message['user_id']}>: {content[:100]}{'...' if len(content) > 100 else ''}"
+        if length + len(line) > 980:
+            message_lines.append(f"...and {len(old_messages) - len(message_lines)} more")
+            break
+        message_lines.append(line)
+        length += len(line) + 1
+    if message_lines:
+        embed.add_field(name='Old Messages', value='\n'.join(message_lines), inline=False)
+
+    embed.set_footer(text="Logged at")
+
+    return embed
+
+
+def parse_search_terms(terms):
+    """
+    Split auditsearch's arguments into the text to search for and keyword arguments for audit.search_messages.
+    """
+    words = []
+    filters = {}
+    for word in terms.split(' '):
+        name, sep, value = word.partition(':')
+        name = name.lower()
+        if not sep or name not in SEARCH_FILTERS or not value:
+            words.append(word)
+            continue
+        try:
+            if name in ('user', 'channel'):
+                filters[f'{name}_id'] = int(re.sub(r'[<@!#&>]', '', value))
+            elif name in ('after', 'before'):
+                filters[name] = datetime.datetime.strptime(value, '%Y-%m-%d')
+            elif name == 'deleted':
+                filters['deleted'] = 1 if value.lower() in ('yes', 'true', '1') else 0
+            elif name == 'page':
+                filters['page'] = max(int(value), 1)
+        except ValueError as e:
+            raise commands.BadArgument(f'Unable to understand {word}') from e
+    return ' '.join(words).strip(), filters
+
+
+def audit_embed_search(guild, query, messages, page, more):
+    embed = discord.Embed(
+        title="Audit Search",
+        description=f"**Results for** `{query[:200]}`" if messages else f"**No results for** `{query[:200]}`",
+        color=discord.Colour.blue(),
+        timestamp=datetime.datetime.now()
+    )
+    for message in messages:
+        content = message['content'] or message['attachment'] or '*empty*'
+        jump_url = f"https://discord.com/channels/{guild.id}/{message['channel_id']}/{message['message_id']}"
+        embed.add_field(
+            name=f"{message['message_date']} UTC{' (deleted)' if message['deleted'] else ''}",
+            value=f"<@{message['user_id']}> in <#{message['channel_id']}> [Jump]({jump_url})\n{content[:300]}{'...' if len(content) > 300 else ''}",
+            inline=False
+        )
+    embed.set_footer(text=f"Page {page}{f', use page:{page + 1} for more' if more else ''}")
+    return embed
+
+
+async def write_history_csv(messages, fp, chunk_size=1000):
+    """
+    Stream messages into fp as a gzipped CSV, chunk_size rows at a time, and rewind fp for uploading.
+    """
+    fields = ['message_date', 'content', 'attachment', 'deleted']
+    with gzip.open(fp, mode='wt', encoding='utf-8', newline='') as gz:
+        writer = csv.DictWriter(gz, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        chunk = []
+        async for message in messages:
+            chunk.append(message)
+            if len(chunk) >= chunk_size:
+                writer.writerows(chunk)
+                chunk = []
+        writer.writerows(chunk)
+    fp.seek(0)
+
+
 async def record_message(message):
-    await audit.insert_message(
+    await audit.queue_message(
         guild_id=message.guild.id if message.guild else 0,
         message_id=message.id,
         user_id=message.author.id,
@@ -334,5 +491,18 @@ async def record_message(message):
     )
 
 
+async def record_edit(guild, data):
+    message_id = int(data['id'])
+    await audit.queue_message(
+        guild_id=guild.id,
+        message_id=message_id,
+        user_id=int(data['author']['id']),
+        channel_id=int(data['channel_id']),
+        message_date=discord.utils.snowflake_time(message_id),
+        content=data['content'],
+        attachment=data['attachments'][0]['url'] if data.get('attachments') else None
+    )
+
+
 def setup(bot):
     bot.add_cog(Audit(bot))
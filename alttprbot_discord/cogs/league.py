@@ -4,14 +4,13 @@ import random
 import traceback
 import logging
 
-import aiohttp
 import discord
 from discord.ext import commands, tasks
 
 from alttprbot.alttprgen import mystery, preset, spoilers
 from alttprbot.database import config, srlnick
 from alttprbot.tournament import league
-from alttprbot.util import speedgaming
+from alttprbot.util import http, speedgaming
 from config import Config as c
 
 from ..util import checks
@@ -158,10 +157,7 @@ class League(commands.Cog):
     @commands.is_owner()
     @restrict_league_server()
     async def importleaguehelper(self, ctx, user: discord.Member, rtgg_tag):
-        async with aiohttp.request(method='get',
-                                   url='https://racetime.gg/user/search',
-                                   params={'term': rtgg_tag}) as resp:
-            results = await resp.json()
+        results = await http.request_generic('https://racetime.gg/user/search', reqparams={'term': rtgg_tag}, returntype='json')
 
         if len(results['results']) > 0:
             for result in results['results']:
@@ -173,11 +169,7 @@ class League(commands.Cog):
     @commands.check_any(commands.has_permissions(manage_roles=True), commands.is_owner())
     @restrict_league_server()
     async def importleagueroles(self, ctx):
-        async with aiohttp.request(
-            method='get',
-            url='https://alttprleague.com/json_ep/roster/'
-        ) as resp:
-            roster = await resp.json()
+        roster = await http.request_generic('https://alttprleague.com/json_ep/roster/', returntype='json')
 
         pendant_roles = {}
         for pendant in ['courage', 'wisdom', 'power']:
@@ -190,27 +182,11 @@ class League(commands.Cog):
     @commands.check_any(commands.has_permissions(manage_roles=True), commands.is_owner())
     @restrict_league_server()
     async def leagueroles(self, ctx, member_tag):
-        async with aiohttp.request(
-            method='get',
-            url='https://alttprleague.com/json_ep/player/',
-            params={
-                'discord': member_tag,
-            },
-            raise_for_status=True
-        ) as resp:
-            r = await resp.json()
-            player = r['results'][0]
-
-        async with aiohttp.request(
-            method='get',
-            url='https://alttprleague.com/json_ep/team/',
-            params={
-                'name': player['team_name'],
-            },
-            raise_for_status=True
-        ) as resp:
-            r = await resp.json()
-            team = r['results'][0]
+        r = await http.request_generic('https://alttprleague.com/json_ep/player/', reqparams={'discord': member_tag}, returntype='json')
+        player = r['results'][0]
+
+        r = await http.request_generic('https://alttprleague.com/json_ep/team/', reqparams={'name': player['team_name']}, returntype='json')
+        team = r['results'][0]
 
         pendant = player['position'].lower()
         division_role = await find_or_create_role(ctx, f"Division - {player['division_name']}")
@@ -272,16 +248,17 @@ async def update_player(ctx, team, division_role, player_role, team_role, pendan
 
         if os.environ.get("LEAGUE_SUBMIT_GAME_SECRET"):
             if not team[pendant].get('discord_id', None) == team_member.id:
-                async with aiohttp.request(
-                    method='post',
-                    url='https://alttprleague.com/json_ep/player/',
+                await http.request(
+                    'post',
+                    'https://alttprleague.com/json_ep/player/',
+                    returntype=None,
+                    raise_for_status=False,
                     data={
                         'id': team[pendant]['id'],
                         'discord_id': team_member.id,
                         'secret': os.environ.get("LEAGUE_SUBMIT_GAME_SECRET")
                     }
-                ) as _:
-                    pass
+                )
         else:
             logging.info(
                 f"Would have updated \"{team[pendant]['discord']}\" ({team[pendant]['id']}) to discord id {team_member.id}")
@@ -1,13 +1,11 @@
 import datetime
 import logging
-import json
 import logging
 
-import aiohttp
 import dateutil.parser
 import discord
 import pytz
-from alttprbot.util import speedgaming
+from alttprbot.util import http, speedgaming
 from alttprbot.database import sgdailies, tournament_results
 from discord.ext import commands, tasks
 from config import Config as c
@@ -24,86 +22,91 @@ class SgDaily(commands.Cog):
         active_sgdailies = await sgdailies.get_active_dailies()
 
         logging.info("scanning SG dailies for races to create")
+        connected_sgdailies = []
         for sgdaily in active_sgdailies:
             if not sgdaily['racetime_category'] in racetime.racetime_bots:
                 logging.error(f"Racetime Bot is not connected to category {sgdaily['racetime_category']}")
                 continue
-            try:
-                episodes = await speedgaming.get_upcoming_episodes_by_event(sgdaily['slug'], hours_past=.25, hours_future=1)
-            except Exception as e:
-                logging.exception("Encountered a problem when attempting to retrieve SG schedule.")
+            connected_sgdailies.append(sgdaily)
+
+        schedules = await speedgaming.scan_schedules({sgdaily['slug']: (.25, 1) for sgdaily in connected_sgdailies})
+
+        jobs = []
+        for sgdaily in connected_sgdailies:
+            episodes = schedules[sgdaily['slug']]
+            if isinstance(episodes, Exception):
+                logging.error("Encountered a problem when attempting to retrieve SG schedule.", exc_info=episodes)
                 continue
-            for episode in episodes:
-                logging.info(episode['id'])
-                try:
-                    rtgg_category = racetime.racetime_bots[sgdaily['racetime_category']]
-                    race = await tournament_results.get_active_tournament_race_by_episodeid(episode['id'])
-
-                    if race:
-                        async with aiohttp.request(
-                                method='get',
-                                url=rtgg_category.http_uri(f"/{race['srl_id']}/data"),
-                                raise_for_status=True) as resp:
-                            race_data = json.loads(await resp.read())
-                        status = race_data.get('status', {}).get('value')
-                        if not status == 'cancelled':
-                            continue
-                        await tournament_results.delete_active_tournament_race(race['srl_id'])
-
-                    start_time = datetime.datetime.strptime(episode['when'], "%Y-%m-%dT%H:%M:%S%z")
-                    seed_time = start_time - datetime.timedelta(minutes=10)
-                    if episode['channels']:
-                        broadcast_channels = " on " + ', '.join([a['name'] for a in episode['channels'] if not " " in a['name']])
-                    else:
-                        broadcast_channels = ""
-                    handler = await rtgg_category.startrace(
-                        goal=sgdaily['racetime_goal'],
-                        invitational=False,
-                        unlisted=False,
-                        info=sgdaily['race_info'].format(
-                            title=episode['match1']['title'],
-                            start_time=start_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
-                            seed_time=seed_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
-                            channel=broadcast_channels
-                        ),
-                        start_delay=15,
-                        time_limit=24,
-                        streaming_required=True,
-                        auto_start=True,
-                        allow_comments=True,
-                        hide_comments=True,
-                        allow_prerace_chat=True,
-                        allow_midrace_chat=True,
-                        allow_non_entrant_chat=False,
-                        chat_message_delay=0
-                    )
-
-                    await tournament_results.insert_tournament_race(
-                        srl_id=handler.data.get('name'),
-                        episode_id=episode['id'],
-                        event=episode['event']['slug']
-                    )
-
-                    channel = self.bot.get_channel(sgdaily['announce_channel'])
-
-                    if channel:
-                        await channel.send(
-                            sgdaily['announce_message'].format(
-                                title=episode['match1']['title'],
-                                start_time=start_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
-                                seed_time=seed_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
-                                racetime_url=f"https://racetime.gg{handler.data['url']}",
-                                channel=broadcast_channels
-                            ),
-                            allowed_mentions=discord.AllowedMentions(roles=True)
-                        )
-
-                except Exception as e:
-                    logging.exception("Encountered a problem when attempting to create RT.gg race room.")
-                    continue
+            jobs += [(sgdaily, episode) for episode in episodes]
+
+        await speedgaming.run_bounded(jobs, lambda job: self.create_race(*job))
 
         logging.info('done')
 
+    async def create_race(self, sgdaily, episode):
+        logging.info(episode['id'])
+        try:
+            rtgg_category = racetime.racetime_bots[sgdaily['racetime_category']]
+            race = await tournament_results.get_active_tournament_race_by_episodeid(episode['id'])
+
+            if race:
+                race_data = await http.request_generic(rtgg_category.http_uri(f"/{race['srl_id']}/data"), returntype='json')
+                status = race_data.get('status', {}).get('value')
+                if not status == 'cancelled':
+                    return
+                await tournament_results.delete_active_tournament_race(race['srl_id'])
+
+            start_time = datetime.datetime.strptime(episode['when'], "%Y-%m-%dT%H:%M:%S%z")
+            seed_time = start_time - datetime.timedelta(minutes=10)
+            if episode['channels']:
+                broadcast_channels = " on " + ', '.join([a['name'] for a in episode['channels'] if not " " in a['name']])
+            else:
+                broadcast_channels = ""
+            handler = await rtgg_category.startrace(
+                goal=sgdaily['racetime_goal'],
+                invitational=False,
+                unlisted=False,
+                info=sgdaily['race_info'].format(
+                    title=episode['match1']['title'],
+                    start_time=start_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
+                    seed_time=seed_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
+                    channel=broadcast_channels
+                ),
+                start_delay=15,
+                time_limit=24,
+                streaming_required=True,
+                auto_start=True,
+                allow_comments=True,
+                hide_comments=True,
+                allow_prerace_chat=True,
+                allow_midrace_chat=True,
+                allow_non_entrant_chat=False,
+                chat_message_delay=0
+            )
+
+            await tournament_results.insert_tournament_race(
+                srl_id=handler.data.get('name'),
+                episode_id=episode['id'],
+                event=episode['event']['slug']
+            )
+
+            channel = self.bot.get_channel(sgdaily['announce_channel'])
+
+            if channel:
+                await channel.send(
+                    sgdaily['announce_message'].format(
+                        title=episode['match1']['title'],
+                        start_time=start_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
+                        seed_time=seed_time.astimezone(pytz.timezone('US/Eastern')).strftime("%-I:%M %p"),
+                        racetime_url=f"https://racetime.gg{handler.data['url']}",
+                        channel=broadcast_channels
+                    ),
+                    allowed_mentions=discord.AllowedMentions(roles=True)
+                )
+
+        except Exception as e:
+            logging.exception("Encountered a problem when attempting to create RT.gg race room.")
+
     @create_races.before_loop
     async def before_create_races(self):
         logging.info('tournament create_races loop waiting...')
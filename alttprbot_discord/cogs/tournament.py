@@ -3,7 +3,6 @@ import datetime
 import io
 import logging
 
-import aiohttp
 import discord
 import pytz
 from discord.ext import commands, tasks
@@ -11,7 +10,7 @@ from discord.ext import commands, tasks
 from alttprbot.database import config, srlnick, tournaments
 from alttprbot.exceptions import SahasrahBotException
 from alttprbot.tournament import alttpr
-from alttprbot.util import speedgaming
+from alttprbot.util import gsheet, http, speedgaming
 from config import Config as c
 
 # this module was only intended for the Main Tournament 2019
@@ -185,13 +184,19 @@ class Tournament(commands.Cog):
     async def tourneyrace(self, ctx, episode_number: int, category: str, goal: str):
         await alttpr.create_tournament_race_room(episode_number, category, goal)
 
+    @commands.command(
+        brief="Re-read tournament sheets now.",
+        help="Throws away the cached copies of tournament sheets, so the next lookup reads them from Google Sheets."
+    )
+    @commands.check_any(commands.has_any_role('Admins', 'Mods'), commands.has_permissions(manage_guild=True), commands.is_owner())
+    async def refreshsheets(self, ctx):
+        gsheet.SNAPSHOTS.invalidate()
+        await ctx.reply("Tournament sheets will be re-read on their next use.")
+
     @commands.command()
     @commands.is_owner()
     async def importhelper(self, ctx, user: discord.Member, rtgg_tag, twitch=None):
-        async with aiohttp.request(method='get',
-                                   url='https://racetime.gg/user/search',
-                                   params={'term': rtgg_tag}) as resp:
-            results = await resp.json()
+        results = await http.request_generic('https://racetime.gg/user/search', reqparams={'term': rtgg_tag}, returntype='json')
 
         if len(results['results']) > 0:
             for result in results['results']:
@@ -218,10 +223,7 @@ class Tournament(commands.Cog):
                 continue
             twitch = i['twitch']
 
-            async with aiohttp.request(method='get',
-                                       url='https://racetime.gg/user/search',
-                                       params={'term': rtgg_tag}) as resp:
-                results = await resp.json()
+            results = await http.request_generic('https://racetime.gg/user/search', reqparams={'term': rtgg_tag}, returntype='json')
 
             if len(results['results']) > 0:
                 for result in results['results']:
@@ -13,7 +13,7 @@ from pytz import timezone
 from alttprbot.alttprgen.preset import get_preset
 from alttprbot.database import srlnick
 from alttprbot.exceptions import SahasrahBotException
-from alttprbot.util import http
+from alttprbot.util import gsheet, http
 from alttprbot_srl.bot import srlbot
 from config import Config as c
 
@@ -181,23 +181,30 @@ class TournamentQualifier(commands.Cog):
 
 
 async def loadnicks(ctx):
-    agcm = gspread_asyncio.AsyncioGspreadClientManager(get_creds)
-    agc = await agcm.authorize()
-    wb = await agc.open_by_key(c.TournamentQualifierSheet)
-    wks = await wb.get_worksheet(0)
+    # row numbers are written back, so they have to come from the sheet as it is now
+    snapshot = await gsheet.SNAPSHOTS.get(c.TournamentQualifierSheet, refresh=True)
+    wks = await gsheet.WORKSHEETS.get(c.TournamentQualifierSheet, 0)
 
     bad_discord_names = []
+    loaded = []
 
     converter = commands.MemberConverter()
-    for idx, row in enumerate(await wks.get_all_records()):
+    for idx, row in enumerate(snapshot.records):
         if not row['Nick Loaded'] in ['Y', 'ignore']:
             try:
                 member = await converter.convert(ctx, row['Discord Name'])
-                await srlnick.insert_srl_nick(member.id, row['SRL Name'])
-                await wks.update_cell(idx+2, 6, 'Y')
             except discord.ext.commands.errors.BadArgument:
                 bad_discord_names.append(row['Discord Name'])
                 await wks.update_cell(idx+2, 6, 'Error')
+                continue
+            loaded.append((idx, row, member))
+
+    await srlnick.insert_srl_nicks([(member.id, row['SRL Name']) for _, row, member in loaded])
+    for idx, row, member in loaded:
+        await wks.update_cell(idx+2, 6, 'Y')
+
+    # we just changed the sheet
+    gsheet.SNAPSHOTS.invalidate(c.TournamentQualifierSheet)
 
     if len(bad_discord_names) > 0:
         await ctx.reply("Bad discord names.  These names were not processed.\n\n`{names}`".format(
@@ -0,0 +1,33 @@
+import argparse
+import os
+import time
+
+import yaml
+
+from alttprbot.alttprgen.mysteryanalyzer import analyze_weightset
+
+parser = argparse.ArgumentParser()
+parser.add_argument('weightset', help='name of a weightset in weights/, or a path to a weightset yaml file')
+parser.add_argument('--rolls', type=int, default=100000)
+parser.add_argument('--seed', type=int, default=None)
+parser.add_argument('--combination', help='comma separated list of settings to report combinations for')
+parser.add_argument('--top', type=int, default=10)
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes to spread the rolls over')
+args = parser.parse_args()
+
+path = args.weightset if os.path.isfile(args.weightset) else os.path.join('weights', f'{args.weightset}.yaml')
+with open(path) as f:
+    weights = yaml.safe_load(f)
+
+start = time.perf_counter()
+analysis = analyze_weightset(
+    weights,
+    rolls=args.rolls,
+    seed=args.seed,
+    combination_keys=args.combination.split(',') if args.combination else None,
+    workers=args.workers
+)
+elapsed = time.perf_counter() - start
+
+print(analysis.report(top=args.top))
+print(f'Finished in {elapsed:.2f} seconds')
@@ -0,0 +1,102 @@
+from dotenv import load_dotenv  # nopep8
+
+load_dotenv()  # nopep8
+
+import argparse
+import asyncio
+import datetime
+import random
+import statistics
+import time
+
+from alttprbot.database import audit
+from alttprbot.util import orm
+
+WORDS = [
+    'seed', 'race', 'bonk', 'pendant', 'crystal', 'ganon', 'tower', 'boots', 'flute', 'mirror', 'hookshot',
+    'hammer', 'lamp', 'swamp', 'skull', 'woods', 'desert', 'palace', 'mire', 'turtle', 'rock', 'glitched',
+    'inverted', 'keysanity', 'mystery', 'spoiler', 'tournament', 'qualifier', 'bracket', 'restream',
+]
+
+parser = argparse.ArgumentParser(description='Time auditsearch queries against the configured database.')
+parser.add_argument('query', help='text to search for')
+parser.add_argument('--guild', type=int, required=True)
+parser.add_argument('--channel', type=int, default=None)
+parser.add_argument('--user', type=int, default=None)
+parser.add_argument('--deleted', type=int, choices=[0, 1], default=None)
+parser.add_argument('--runs', type=int, default=50)
+parser.add_argument('--page', type=int, default=1)
+parser.add_argument('--page-size', type=int, default=10)
+parser.add_argument('--like', action='store_true', help='also time the equivalent LIKE scan, for comparison')
+parser.add_argument('--populate', type=int, default=0,
+                    help='first insert this many random messages into --guild, only do this against a test database')
+args = parser.parse_args()
+
+
+async def populate(count):
+    now = datetime.datetime.utcnow()
+    rows = []
+    for i in range(count):
+        rows.append((
+            args.guild,
+            random.getrandbits(62),
+            random.randint(1, 5000),
+            random.randint(1, 50),
+            now - datetime.timedelta(seconds=random.randint(0, 86400 * 365)),
+            ' '.join(random.choices(WORDS, k=random.randint(3, 20))),
+            None
+        ))
+        if len(rows) >= 10000:
+            await audit.insert_messages(rows)
+            rows = []
+    await audit.insert_messages(rows)
+
+
+async def time_runs(func):
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        results = await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, len(results)
+
+
+def report(name, timings, count):
+    timings = sorted(timings)
+    print(f'{name}: {count} results, '
+          f'mean {statistics.mean(timings):.2f}ms, '
+          f'p50 {timings[len(timings) // 2]:.2f}ms, '
+          f'p95 {timings[min(int(len(timings) * 0.95), len(timings) - 1)]:.2f}ms, '
+          f'max {timings[-1]:.2f}ms')
+
+
+async def main():
+    if args.populate:
+        start = time.perf_counter()
+        await populate(args.populate)
+        print(f'Inserted {args.populate} messages in {time.perf_counter() - start:.2f} seconds')
+
+    total = await orm.select('SELECT COUNT(*) AS total from audit_messages WHERE guild_id=%s;', [args.guild])
+    print(f"{total[0]['total']} messages logged for guild {args.guild}")
+
+    filters = dict(channel_id=args.channel, user_id=args.user, deleted=args.deleted)
+    offset = (args.page - 1) * args.page_size
+
+    timings, count = await time_runs(lambda: audit.search_messages(
+        args.guild, args.query, limit=args.page_size, offset=offset, **filters))
+    report('fulltext', timings, count)
+
+    if args.like:
+        sql = 'SELECT id from audit_messages WHERE guild_id=%s and content LIKE %s'
+        sql_args = [args.guild, f'%{args.query}%']
+        for column, value in filters.items():
+            if value is not None:
+                sql += f' and {column}=%s'
+                sql_args.append(value)
+        sql += ' order by message_date desc LIMIT %s OFFSET %s;'
+        sql_args += [args.page_size, offset]
+        timings, count = await time_runs(lambda: orm.select(sql, sql_args))
+        report('like', timings, count)
+
+
+asyncio.get_event_loop().run_until_complete(main())
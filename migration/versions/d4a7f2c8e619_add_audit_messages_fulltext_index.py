@@ -0,0 +1,33 @@
+"""add audit_messages fulltext index
+
+Revision ID: d4a7f2c8e619
+Revises: b3e91d7c5a20
+Create Date: 2021-05-22 16:48:05.377190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7f2c8e619'
+down_revision = 'b3e91d7c5a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a binary collation would make the fulltext search case sensitive
+    op.alter_column('audit_messages', 'content',
+               existing_type=mysql.VARCHAR(collation='utf8mb4_bin', length=4000),
+               type_=sa.String(length=4000, collation='utf8mb4_unicode_ci'),
+               existing_nullable=True)
+    op.create_index('idx_audit_messages_content_fulltext', 'audit_messages', ['content'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    op.drop_index('idx_audit_messages_content_fulltext', table_name='audit_messages')
+    op.alter_column('audit_messages', 'content',
+               existing_type=sa.String(length=4000, collation='utf8mb4_unicode_ci'),
+               type_=mysql.VARCHAR(collation='utf8mb4_bin', length=4000),
+               existing_nullable=True)
@@ -3,10 +3,15 @@ load_dotenv()  # nopep8
 
 import asyncio
 import os
+import signal
 
 import sentry_sdk
 from sentry_sdk.integrations.aiohttp import AioHttpIntegration
 
+from alttprbot.alttprgen.preset import load_all_presets, start_seed_pools
+from alttprbot.database import audit
+from alttprbot.util import bps, http, storage
+from alttprbot.util.holyimage import start_catalog_refresh
 from alttprbot_api.api import sahasrahbotapi
 from alttprbot_discord.bot import discordbot
 from alttprbot_racetime.bot import start_racetime
@@ -20,12 +25,30 @@ if os.environ.get("SENTRY_URL"):
     )
 
 
+async def shutdown():
+    # write out anything still buffered before we go
+    await audit.MESSAGE_WRITER.close()
+    await audit.DELETION_WRITER.close()
+    await http.close()
+    await storage.STORAGE.close()
+
+
 if __name__ == '__main__':
     loop = asyncio.get_event_loop()
+    loop.run_until_complete(load_all_presets())
+    start_seed_pools(loop)
+    start_catalog_refresh(loop)
+    bps.start_loading_sources(loop, [os.environ.get('ALTTP_ROM'), os.environ.get('SM_ROM')])
     loop.create_task(discordbot.start(os.environ.get("DISCORD_TOKEN")))
     loop.create_task(twitchbot.start())
     start_racetime(loop)
     loop.create_task(srlbot.connect('irc.speedrunslive.com'))
     loop.create_task(sahasrahbotapi.run(host='127.0.0.1',
                                         port=5001, use_reloader=False, loop=loop))
-    loop.run_forever()
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(shutdown())